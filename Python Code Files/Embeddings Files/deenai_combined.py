@@ -0,0 +1,60 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+# Share the lazily-built clients of the web app's registry
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Helper Files"))
+from registry_helper import get_pinecone_client, COMBINED_INDEX_NAME, VECTOR_BACKEND
+from ingest_helper import upsert_documents
+from deenai_rag_pine import load_quran_csv
+from deenai_sahih_bukhari import load_sahi_bukhari_csv
+from deenai_sahih_muslim import load_sahi_muslim_csv
+
+# Load environment variables
+load_dotenv()
+
+# Constants
+DIMENSIONS = 768  # Google embedding size
+REGION = "us-east-1"
+
+# One index for all three collections; every loader tags its documents
+# with a "source" metadata field ("quran", "bukhari" or "muslim") so the summary can rank
+# globally in one query and the per-source helpers can filter on it
+LOADERS = {
+    "quran": load_quran_csv,
+    "bukhari": load_sahi_bukhari_csv,
+    "muslim": load_sahi_muslim_csv
+}
+
+# Create the combined Pinecone index if it does not exist yet
+def ensure_index_combined():
+    if VECTOR_BACKEND != "pinecone":
+        return
+    from pinecone import ServerlessSpec
+    pc = get_pinecone_client()
+    if COMBINED_INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=COMBINED_INDEX_NAME,
+            dimension=DIMENSIONS,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=REGION)
+        )
+
+# Upsert every collection into the combined index; ids are already
+# prefixed with their source ("quran:2:255", "bukhari:1"), so they never clash
+def create_vector_store_combined(batch_size=100):
+    ensure_index_combined()
+    failed = 0
+    for source, load_documents in LOADERS.items():
+        print(f"🔄 Syncing {source}...")
+        failed += upsert_documents(load_documents(), COMBINED_INDEX_NAME, batch_size)
+    return failed
+
+def main_combined():
+    print("📖 DeenAI: Syncing the combined index")
+    failed = create_vector_store_combined()
+    if not failed:
+        print("✅ Combined index is up to date. Set USE_COMBINED_INDEX=1 to query it.")
+
+if __name__ == "__main__":
+    main_combined()
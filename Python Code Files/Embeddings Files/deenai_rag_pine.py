@@ -1,17 +1,12 @@
 import os
-import pandas as pd
+import sys
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.documents import Document
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableMap
-from langchain_core.output_parsers import StrOutputParser
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone as PineconeClient, ServerlessSpec
-from tqdm import tqdm
-
-
 
+# Share the lazily-built clients of the web app's registry
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Helper Files"))
+from registry_helper import get_llm, get_pinecone_client, get_vector_store, VECTOR_BACKEND
+from ingest_helper import iter_csv_documents, quran_id, upsert_documents
 
 # Load environment variables
 load_dotenv()
@@ -23,71 +18,66 @@ CSV_PATH = r"D:\Air Uni Notes\Semester 4\Information Retrieval\IR Project\GitHub
 INDEX_NAME = "quran-index"
 DIMENSIONS = 768 # Google embedding size
 REGION = "us-east-1"
+SOURCE = "quran"  # Value of the "source" metadata field in the combined index
+
+LLM_TEMPERATURE = 0
+
+# Create the Pinecone index if it does not exist yet; nothing touches the
+# network until the console app actually starts
+def ensure_index():
+    if VECTOR_BACKEND != "pinecone":
+        return
+    from pinecone import ServerlessSpec
+    pc = get_pinecone_client()
+    if INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=DIMENSIONS,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=REGION)
+        )
 
-# Set up LLM and embeddings
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0, google_api_key=gem_api)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=gem_api)
-
-# Pinecone setup
-pc = PineconeClient(api_key=pinecone_api)
+# Convert one Qur’an CSV row into a Document
+def make_quran_document(row):
+    from langchain_core.documents import Document
 
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=DIMENSIONS,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region=REGION)
+    content = (
+        f"**Surah {row['Surah Name (English)']} ({row['Surah Name (Arabic)']}), "
+        f"Surah {row['Surah Number']}, Ayah {int(row['Ayah Number'])}:**\n"
+        f"{row['Ayah Translation']}"
     )
-
-# Load and chunk Qur’an CSV
+    metadata = {
+        "source": SOURCE,
+        "surah_english": row['Surah Name (English)'],
+        "surah_arabic": row['Surah Name (Arabic)'],
+        "surah_number": row["Surah Number"],
+        "ayah_number": row["Ayah Number"],
+        "revelation_type": row.get("Revelation Type", "Unknown")
+    }
+    return Document(id=quran_id(row["Surah Number"], row["Ayah Number"]), page_content=content, metadata=metadata)
+
+# Stream the Qur’an CSV as Documents, one per ayah; no chunking needed
+# since ayahs are already concise
 def load_quran_csv():
-    df = pd.read_csv(CSV_PATH, encoding="utf-8")
-    documents = []
-    for _, row in df.iterrows():
-        content = (
-            f"**Surah {row['Surah Name (English)']} ({row['Surah Name (Arabic)']}), "
-            f"Surah {row['Surah Number']}, Ayah {int(row['Ayah Number'])}:**\n"
-            f"{row['Ayah Translation']}"
-        )
-        metadata = {
-            "surah_english": row['Surah Name (English)'],
-            "surah_arabic": row['Surah Name (Arabic)'],
-            "surah_number": row["Surah Number"],
-            "ayah_number": row["Ayah Number"],
-            "revelation_type": row.get("Revelation Type", "Unknown")
-        }
-        documents.append(Document(page_content=content, metadata=metadata))
-    return documents  # No chunking needed if ayahs are already concise
-
-
-# Create vector store using Pinecone
-def create_vector_store(documents, batch_size=100):
-    vector_store = PineconeVectorStore(
-        index_name=INDEX_NAME,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
-    )
+    return iter_csv_documents(CSV_PATH, make_quran_document)
 
-    # Batch upload to avoid exceeding 4MB API limit
-    for i in tqdm(range(0, len(documents), batch_size), desc="🔁 Uploading to Pinecone"):
-        batch = documents[i:i+batch_size]
-        try:
-            vector_store.add_documents(batch)
-        except Exception as e:
-            print(f"❌ Error uploading batch {i}-{i+batch_size}: {e}")
 
-    print(f"\n✅ Successfully uploaded {len(documents)} documents to Pinecone.")
+# Upsert documents into Pinecone under their stable ids
+def create_vector_store(documents, batch_size=100):
+    ensure_index()
+    return upsert_documents(documents, INDEX_NAME, batch_size)
 
 # Load Pinecone vector store
 def load_vector_store():
-    return PineconeVectorStore(
-        index_name=INDEX_NAME,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
-    )
+    return get_vector_store(INDEX_NAME)
 
 # QA Prompt
+@lru_cache(maxsize=None)
 def get_conversational_chain():
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnableMap
+    from langchain_core.output_parsers import StrOutputParser
+
     prompt_template = """You are DeenAI, an Islamic assistant helping users with authentic responses directly from the Qur'an.
 
 Given the following context (extracted from the Qur'an), answer the user's question **strictly based** on the Ayah translations provided.
@@ -114,7 +104,7 @@ Answer:
             "question": lambda x: x["question"]
         })
         | prompt
-        | llm
+        | get_llm(temperature=LLM_TEMPERATURE)
         | StrOutputParser()
     )
     return chain
@@ -129,14 +119,11 @@ def user_query(query):
 # Console Interface
 def main_quran():
     print("📖 DeenAI: Console Qur'an QA (Pinecone-based)")
-    index = pc.Index(INDEX_NAME)
-    if index.describe_index_stats().total_vector_count == 0:
-        print("🔄 Pinecone index is empty. Uploading data...")
-        docs = load_quran_csv()
-        create_vector_store(docs)
-        print("✅ Data uploaded to Pinecone.")
-    else:
-        print("✅ Pinecone index already contains data.")
+    # Safe to run every time: finished batches are skipped, missing or
+    # failed ones are upserted again without duplicating vectors
+    print("🔄 Syncing CSV data into the index...")
+    docs = load_quran_csv()
+    create_vector_store(docs)
 
     print("\n💬 Ask a question from the Qur'an. Type 'exit' to quit.")
     while True:
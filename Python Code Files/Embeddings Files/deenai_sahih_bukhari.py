@@ -1,14 +1,12 @@
 import os
-import pandas as pd
+import sys
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.documents import Document
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableMap
-from langchain_core.output_parsers import StrOutputParser
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone as PineconeClient, ServerlessSpec
-from tqdm import tqdm
+
+# Share the lazily-built clients of the web app's registry
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Helper Files"))
+from registry_helper import get_llm, get_pinecone_client, get_vector_store, VECTOR_BACKEND
+from ingest_helper import hadith_id, iter_csv_documents, upsert_documents
 
 # Load environment variables
 load_dotenv()
@@ -20,70 +18,73 @@ CSV_PATH = r"D:\Air Uni Notes\Semester 4\Information Retrieval\IR Project\GitHub
 INDEX_NAME = "sahibukhari-index"
 DIMENSIONS = 768  # Google embedding size
 REGION = "us-east-1"
+SOURCE = "bukhari"  # Value of the "source" metadata field in the combined index
+
+LLM_TEMPERATURE = 0
+
+# Create the Pinecone index if it does not exist yet; nothing touches the
+# network until the console app actually starts
+def ensure_index_sahi_bukhari():
+    if VECTOR_BACKEND != "pinecone":
+        return
+    from pinecone import ServerlessSpec
+    pc = get_pinecone_client()
+    if INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=DIMENSIONS,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=REGION)
+        )
 
-# Set up LLM and embeddings
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0, google_api_key=gem_api)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=gem_api)
-
-# Pinecone setup
-pc = PineconeClient(api_key=pinecone_api)
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=DIMENSIONS,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region=REGION)
-    )
+# Convert one CSV row into a Document
+def make_sahi_bukhari_document(row):
+    from langchain_core.documents import Document
 
-# Load and convert CSV into Documents
-def load_sahi_bukhari_csv():
-    df = pd.read_csv(CSV_PATH, encoding="utf-8")
-    documents = []
-    for _, row in df.iterrows():
-        content = (
-            f"**Hadith {row['hadithNumber']}**\n"
-            f"**Narrated by:** {row['englishNarrator']}\n"
-            f"**Book:** {row['bookName']} | **Chapter:** {row['chapterEnglish']}\n\n"
-            f"{row['hadithEnglish']}"
-        )
-        metadata = {
-            "hadithNumber": row["hadithNumber"],
-            "englishNarrator": row["englishNarrator"],
-            "bookName": row["bookName"],
-            "chapterEnglish": row["chapterEnglish"],
-            "writerName": row.get("writerName", ""),
-            "volume": row.get("volume", ""),
-            "status": row.get("status", "")
-        }
-        documents.append(Document(page_content=content, metadata=metadata))
-    return documents
-
-# Create Pinecone vector store
-def create_vector_store_sahi_bukhari(documents, batch_size=100):
-    vector_store = PineconeVectorStore(
-        index_name=INDEX_NAME,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
+    content = (
+        f"**Hadith {row['hadithNumber']}**\n"
+        f"**Narrated by:** {row['englishNarrator']}\n"
+        f"**Book:** {row['bookName']} | **Chapter:** {row['chapterEnglish']}\n\n"
+        f"{row['hadithEnglish']}"
     )
+    metadata = {
+        "source": SOURCE,
+        "hadithNumber": row["hadithNumber"],
+        "englishNarrator": row["englishNarrator"],
+        "bookName": row["bookName"],
+        "chapterEnglish": row["chapterEnglish"],
+        "writerName": row.get("writerName", ""),
+        "volume": row.get("volume", ""),
+        "status": row.get("status", "")
+    }
+    return Document(id=hadith_id(SOURCE, row["hadithNumber"]), page_content=content, metadata=metadata)
+
+# Stream the CSV as Documents; the ingestion batches pull from this
+# generator, so embedding starts as soon as the first batch is parsed.
+# Near-duplicate matns are folded into one document on the way
+# (dedup_helper; DEDUP_HADITH=0 keeps every row)
+def load_sahi_bukhari_csv():
+    from dedup_helper import DEDUP_HADITH, collapse_near_duplicates
+    if DEDUP_HADITH:
+        return collapse_near_duplicates(lambda: iter_csv_documents(CSV_PATH, make_sahi_bukhari_document))
+    return iter_csv_documents(CSV_PATH, make_sahi_bukhari_document)
 
-    for i in tqdm(range(0, len(documents), batch_size), desc="🔁 Uploading to Pinecone"):
-        batch = documents[i:i+batch_size]
-        try:
-            vector_store.add_documents(batch)
-        except Exception as e:
-            print(f"❌ Error uploading batch {i}-{i+batch_size}: {e}")
-    print(f"\n✅ Successfully uploaded {len(documents)} documents to Pinecone.")
+# Upsert documents into Pinecone under their stable ids
+def create_vector_store_sahi_bukhari(documents, batch_size=100):
+    ensure_index_sahi_bukhari()
+    return upsert_documents(documents, INDEX_NAME, batch_size)
 
 # Load vector store for searching
 def load_vector_store_sahi_bukhari():
-    return PineconeVectorStore(
-        index_name=INDEX_NAME,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
-    )
+    return get_vector_store(INDEX_NAME)
 
 # Build modern QA chain using RunnableMap
+@lru_cache(maxsize=None)
 def get_conversational_chain_sahi_bukhari():
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnableMap
+    from langchain_core.output_parsers import StrOutputParser
+
     prompt_template = """You are DeenAI, an Islamic assistant helping users with authentic responses strictly from authentic Hadith sources.
 
 Given the following context (extracted from the Hadith), answer the user's question **strictly based** on the Hadith translations provided.
@@ -116,7 +117,7 @@ Answer:
             "question": lambda x: x["question"]
         })
         | prompt
-        | llm
+        | get_llm(temperature=LLM_TEMPERATURE)
         | StrOutputParser()
     )
     return chain
@@ -131,14 +132,11 @@ def user_query_sahi_bukhari(query):
 # Console app
 def main_sahi_bukhari():
     print("📖 DeenAI: Console Hadith QA (Pinecone-based)")
-    index = pc.Index(INDEX_NAME)
-    if index.describe_index_stats().total_vector_count == 0:
-        print("🔄 Pinecone index is empty. Uploading data...")
-        docs = load_sahi_bukhari_csv()
-        create_vector_store_sahi_bukhari(docs)
-        print("✅ Data uploaded to Pinecone.")
-    else:
-        print("✅ Pinecone index already contains data.")
+    # Safe to run every time: finished batches are skipped, missing or
+    # failed ones are upserted again without duplicating vectors
+    print("🔄 Syncing CSV data into the index...")
+    docs = load_sahi_bukhari_csv()
+    create_vector_store_sahi_bukhari(docs)
 
     print("\n💬 Ask a question from Sahih Bukhari. Type 'exit' to quit.")
     while True:
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import numpy as np
+
+# In-process semantic answer cache. Each entry holds the unit-length
+# question embedding and the four-part answer of one turn; a new question
+# whose embedding has cosine similarity >= threshold with a cached one
+# (under the same filters) reuses that answer instead of retrieval and
+# four LLM generations. Embeddings live in one preallocated matrix, so a
+# lookup is a single matrix-vector product. Entries are evicted least
+# recently used first when the entry count or the memory cap is reached,
+# expire after `ttl` seconds, and are all dropped when the version (prompt,
+# models, indexes) changes
+class SemanticAnswerCache:
+    def __init__(self, threshold: float, max_entries: int, max_bytes: int, ttl: float):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.version = None
+        self.vectors = None  # [max_entries, dims], allocated on the first store
+        self.entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()  # Row -> entry, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # Drop everything when the prompt, model or index version has moved on
+    def check_version(self, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        if self.vectors is not None:
+            self.vectors[:] = 0  # Free rows score 0 and never pass the threshold
+
+    def drop(self, row: int):
+        self.size -= self.entries.pop(row)["size"]
+        self.vectors[row] = 0
+
+    # Cached answers for the closest stored question, or None
+    def lookup(self, embedding, filters=None, version=None) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            self.check_version(version)
+            if not self.entries:
+                self.misses += 1
+                return None
+            query = normalize(embedding)
+            if len(query) != self.vectors.shape[1]:
+                self.misses += 1
+                return None
+            scores = self.vectors @ query
+            key, now = filters_key(filters), time.time()
+            for row in np.flatnonzero(scores >= self.threshold)[np.argsort(-scores[scores >= self.threshold])].tolist():
+                entry = self.entries.get(row)
+                if entry is None:
+                    continue  # A free row, only reachable with a threshold <= 0
+                if now - entry["created"] > self.ttl:
+                    self.drop(row)
+                elif entry["filters"] == key:
+                    self.entries.move_to_end(row)
+                    self.hits += 1
+                    return dict(entry["answers"])
+            self.misses += 1
+            return None
+
+    def store(self, embedding, answers: Dict[str, Any], filters=None, version=None):
+        with self.lock:
+            self.check_version(version)
+            query = normalize(embedding)
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+            size = query.nbytes + sum(len(str(value)) for value in answers.values())
+            if size > self.max_bytes or len(query) != self.vectors.shape[1]:
+                return
+            while self.entries and (len(self.entries) >= self.max_entries or self.size + size > self.max_bytes):
+                self.drop(next(iter(self.entries)))
+            used = set(self.entries)
+            row = next(row for row in range(self.max_entries) if row not in used)
+            self.vectors[row] = query
+            self.entries[row] = {"answers": dict(answers), "filters": filters_key(filters), "created": time.time(), "size": size}
+            self.size += size
+
+    def describe(self) -> str:
+        return f"Answer cache: {len(self.entries)} answers, {self.size / 2**20:.1f} MB, {self.hits} hits, {self.misses} misses."
+
+def normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+# Filters take part in the key: the same question under other filters
+# has other evidence
+def filters_key(filters) -> str:
+    return json.dumps(filters or {}, sort_keys=True, default=str)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+
+TOUCH_EVERY = 60.0  # A hit rewrites its `used` time only when that is older than this many seconds
+PRUNE_TO = 0.9  # Pruning deletes down to this share of the cap, so it runs once per many inserts
+
+# Persistent exact-match answer store shared by every worker process.
+# Answers are kept as JSON in SQLite under sha256(normalized question +
+# namespace), where the namespace carries everything else the answer
+# depends on (sources, filters, prompt hash, models, index version). WAL
+# mode lets any number of processes read while one writes. When the
+# database's used pages outgrow the size cap, the least recently used
+# answers are deleted. Reads only write when `used` has gone stale, and the
+# size check is two PRAGMAs, so neither hits nor inserts scan the table
+class AnswerStore:
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, question TEXT NOT NULL, answers TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_used ON answers (used)")
+        self.conn.commit()
+        self.page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+
+    def key(self, question: str, namespace: str) -> str:
+        return hashlib.sha256(f"{namespace}\n{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def get(self, question: str, namespace: str) -> Optional[Dict[str, Any]]:
+        key = self.key(question, namespace)
+        with self.lock:
+            row = self.conn.execute("SELECT answers, used FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            if now - row[1] > TOUCH_EVERY:
+                self.conn.execute("UPDATE answers SET used = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, question: str, namespace: str, answers: Dict[str, Any]):
+        blob = json.dumps(answers, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers (key, question, answers, size, created, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(question, namespace), normalize_question(question), blob, len(blob.encode("utf-8")), now, now)
+            )
+            if self.used_bytes() > self.max_bytes:
+                self.prune()
+            self.conn.commit()
+
+    # Bytes in pages that hold data; deleted rows return their pages to the freelist
+    def used_bytes(self) -> int:
+        pages = self.conn.execute("PRAGMA page_count").fetchone()[0] - self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return pages * self.page_size
+
+    # Delete the least recently used answers, a twentieth of them at a
+    # time, until the pages in use are down to PRUNE_TO of the cap; the
+    # newest answer always stays. Caller holds the lock
+    def prune(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        while count > 1 and self.used_bytes() > PRUNE_TO * self.max_bytes:
+            step = max(1, min(count // 20, count - 1))
+            self.conn.execute("DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY used LIMIT ?)", (step,))
+            count -= step
+
+    def contains(self, question: str, namespace: str) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM answers WHERE key = ?", (self.key(question, namespace),)).fetchone() is not None
+
+    def delete(self, question: str, namespace: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM answers WHERE key = ?", (self.key(question, namespace),))
+            self.conn.commit()
+
+    def describe(self) -> str:
+        with self.lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            size = self.used_bytes()
+        return f"Answer store: {count} answers, {size / 2**20:.1f} MB, {self.hits} hits, {self.misses} misses."
+
+# "  How do I perform Salah?? " and "how do i perform salah" share a key
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).casefold()
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!.。؟ ").strip()
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import tracemalloc
+
+# Compares the streaming CSV loader with the old read-everything loader
+# (pd.read_csv + df.iterrows + one big list) on both hadith CSVs.
+# Run `python benchmark_csv_loader.py [bukhari.csv] [muslim.csv]`; paths
+# default to the CSV_PATH of each helper. Both loaders are drained the way
+# upsert_documents drains them, one batch at a time, and the report shows
+# when the first batch is ready, the total time and the peak Python memory.
+
+import sahih_bhukari_helper
+import sahih_muslim_helper
+from ingest_helper import iter_batches, iter_csv_documents
+
+# Constants
+BATCH_SIZE = 100
+
+# The loader as it was before streaming, kept here as the baseline
+def load_with_iterrows(path, make_document):
+    import pandas as pd
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    documents = []
+    for _, row in df.iterrows():
+        documents.append(make_document(row))
+    return documents
+
+# Drain documents batch by batch; returns (first batch s, total s, peak MiB, documents)
+def measure(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_batch = None
+    count = 0
+    for batch in iter_batches(load(), BATCH_SIZE):
+        if first_batch is None:
+            first_batch = time.perf_counter() - start
+        count += len(batch)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_batch or total, total, peak / 2**20, count
+
+def main() -> int:
+    # Load pandas and langchain once so neither run pays for the imports
+    import pandas  # noqa: F401
+    from langchain_core.documents import Document  # noqa: F401
+
+    paths = sys.argv[1:3] + [None] * (2 - len(sys.argv[1:3]))
+    cases = [
+        ("Sahih Bukhari", paths[0] or sahih_bhukari_helper.CSV_PATH, sahih_bhukari_helper.make_sahi_bukhari_document),
+        ("Sahih Muslim", paths[1] or sahih_muslim_helper.CSV_PATH, sahih_muslim_helper.make_sahi_muslim_document)
+    ]
+    for name, path, make_document in cases:
+        if not os.path.exists(path):
+            print(f"⚠️ {name}: {path} not found, skipped.")
+            continue
+        print(f"📖 {name} ({os.path.basename(path)})")
+        for label, load in [
+            ("iterrows + list", lambda: load_with_iterrows(path, make_document)),
+            ("streaming", lambda: iter_csv_documents(path, make_document))
+        ]:
+            first_batch, total, peak, count = measure(load)
+            print(f"   {label:<16} {count} docs | first batch {first_batch * 1000:8.1f} ms | total {total * 1000:8.1f} ms | peak {peak:6.1f} MiB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
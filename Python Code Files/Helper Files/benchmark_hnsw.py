@@ -0,0 +1,95 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Recall-vs-latency report for the HNSW engine of the local vector store,
+# measured against exact search on the collections under LOCAL_INDEX_DIR
+# (build them with VECTOR_BACKEND=local and the Embeddings Files scripts).
+# Run `python benchmark_hnsw.py`; `--M 8 16 32 --ef-search 16 64 256` picks
+# the grid, `--queries questions.npy` uses real question embeddings
+# instead of perturbed document vectors, and `--synthetic 50000` adds a
+# clustered random collection to see how the numbers scale.
+
+from hnsw_index import HNSWIndex
+from merger_helper import indexes
+from registry_helper import LOCAL_INDEX_DIR
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+# Document vectors nudged off their stored position, so a query is near
+# but not exactly on a node
+def sample_queries(vectors: np.ndarray, count: int, rng) -> np.ndarray:
+    picked = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+    return normalize(picked + rng.normal(scale=0.01, size=picked.shape).astype(np.float32))
+
+def synthetic_collection(size: int, rng) -> np.ndarray:
+    centers = rng.normal(size=(max(size // 100, 1), 768))
+    return normalize((centers[rng.integers(0, len(centers), size)] + rng.normal(size=(size, 768))).astype(np.float32))
+
+# Mean and 95th percentile latency in milliseconds, and the results
+def timed_search(search, queries):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.mean(latencies), np.percentile(latencies, 95), results
+
+def report(name: str, vectors: np.ndarray, queries: np.ndarray, args):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    k = args.k
+    print(f"\n📖 {name}: {len(vectors)} vectors, {len(queries)} queries, recall@{k} against exact search")
+    mean, p95, exact = timed_search(lambda q: np.argsort(-(vectors @ q))[:k], queries)
+    truth = [set(rows.tolist()) for rows in exact]
+    print(f"   {'engine':<8}{'M':>4}{'ef':>6}{'recall':>9}{'mean ms':>10}{'p95 ms':>9}{'build s':>10}{'graph MB':>10}")
+    print(f"   {'exact':<8}{'-':>4}{'-':>6}{1.0:>9.3f}{mean:>10.2f}{p95:>9.2f}{'-':>10}{'-':>10}")
+
+    for M in args.M:
+        index = HNSWIndex(M=M, ef_construction=args.ef_construction)
+        start = time.perf_counter()
+        index.add(vectors, range(len(vectors)))
+        build = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as folder:
+            graph_path = os.path.join(folder, "hnsw.bin")
+            index.save(graph_path)
+            size = os.path.getsize(graph_path) / 2**20
+            index = HNSWIndex.load(graph_path)
+            for ef in args.ef_search:
+                mean, p95, found = timed_search(lambda q: index.search(vectors, q, k, ef=ef)[0], queries)
+                recall = np.mean([len(t & set(rows.tolist())) / k for t, rows in zip(truth, found)])
+                print(f"   {'hnsw':<8}{M:>4}{ef:>6}{recall:>9.3f}{mean:>10.2f}{p95:>9.2f}{build:>10.1f}{size:>10.2f}")
+            del index
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="HNSW recall@k and latency against exact search")
+    parser.add_argument("--M", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--queries", help="Optional .npy file of question embeddings")
+    parser.add_argument("--synthetic", type=int, default=0, help="Also benchmark a clustered random collection of this size")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    collections = {}
+    for index_name in indexes.values():
+        vectors_path = os.path.join(LOCAL_INDEX_DIR, index_name, "vectors.npy")
+        if os.path.exists(vectors_path):
+            collections[index_name] = np.load(vectors_path, mmap_mode="r")
+        else:
+            print(f"⚠️ {index_name}: no local index at {vectors_path}, skipped.")
+    if args.synthetic:
+        collections[f"synthetic-{args.synthetic}"] = synthetic_collection(args.synthetic, rng)
+
+    for name, vectors in collections.items():
+        queries = normalize(np.load(args.queries).astype(np.float32)) if args.queries else sample_queries(np.asarray(vectors), args.num_queries, rng)
+        report(name, vectors, queries, args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Memory, latency and recall@k of the compressed local scan (float16,
+# int8 and product quantization codes, PCA and random projections to
+# fewer dimensions, each rescored in float32) against the exact float32
+# scan, on the collections under LOCAL_INDEX_DIR. Each run works on a
+# temporary copy, so no codes are written next to the real index.
+# `--rescore 1 4 10` sets the candidates kept per result before the
+# float32 rescoring (1 measures the compressed ranking on its own);
+# `--synthetic 50000` adds a clustered random collection
+
+from benchmark_hnsw import normalize, sample_queries, synthetic_collection, timed_search
+from local_vector_store import DOCS_FILE, VECTORS_FILE, LocalVectorStore
+from merger_helper import indexes
+from registry_helper import LOCAL_INDEX_DIR
+
+# A scratch collection directory over the given vectors
+def scratch_collection(folder: str, vectors: np.ndarray, source: str = None) -> str:
+    path = os.path.join(folder, "collection")
+    os.makedirs(path)
+    if source:
+        for name in (VECTORS_FILE, DOCS_FILE):
+            shutil.copy(os.path.join(source, name), os.path.join(path, name))
+        return path
+    np.save(os.path.join(path, VECTORS_FILE), vectors)
+    with open(os.path.join(path, DOCS_FILE), "w", encoding="utf-8") as f:
+        for row in range(len(vectors)):
+            f.write(json.dumps({"id": str(row), "page_content": "", "metadata": {}}) + "\n")
+    return path
+
+def report(name: str, vectors: np.ndarray, queries: np.ndarray, args, source: str = None):
+    k = args.k
+    print(f"\n📖 {name}: {len(vectors)} vectors, {len(queries)} queries, recall@{k} against the float32 scan")
+    print(f"   {'codes':<14}{'rescore':>8}{'MB':>9}{'ratio':>7}{'fit s':>8}{'recall':>9}{'mean ms':>10}{'p95 ms':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        path = scratch_collection(folder, vectors, source)
+        exact_store = LocalVectorStore(path, None)
+        full_mb = exact_store.vectors.nbytes / 2**20
+        mean, p95, exact = timed_search(lambda q: exact_store.search_rows(q, k)[0], queries)
+        truth = [set(rows.tolist()) for rows in exact]
+        print(f"   {'float32':<14}{'-':>8}{full_mb:>9.1f}{1.0:>7.1f}{'-':>8}{1.0:>9.3f}{mean:>10.2f}{p95:>9.2f}")
+
+        settings = [(kind, None) for kind in args.codes]
+        settings += [(None, {"method": method, "dims": dims}) for method in args.projection for dims in args.dims]
+        for quantization, projection in settings:
+            start = time.perf_counter()
+            store = LocalVectorStore(path, None, quantization=quantization, projection=projection)
+            fit = time.perf_counter() - start
+            kind = store.codec.kind.replace("/float32", "")
+            codes_mb = store.codes.nbytes / 2**20
+            for factor in args.rescore:
+                store.rescore_factor = factor
+                mean, p95, found = timed_search(lambda q: store.search_rows(q, k)[0], queries)
+                recall = np.mean([len(t & set(rows.tolist())) / k for t, rows in zip(truth, found)])
+                print(f"   {kind:<14}{factor:>8}{codes_mb:>9.1f}{full_mb / codes_mb:>7.1f}{fit:>8.1f}{recall:>9.3f}{mean:>10.2f}{p95:>9.2f}")
+                fit = 0.0  # Only the first row pays for fitting the codes
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compressed scan memory, recall@k and latency against float32")
+    parser.add_argument("--codes", nargs="+", default=["float16", "int8", "pq"])
+    parser.add_argument("--projection", nargs="*", default=["pca", "random"])
+    parser.add_argument("--dims", type=int, nargs="+", default=[128, 256])
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--queries", help="Optional .npy file of question embeddings")
+    parser.add_argument("--synthetic", type=int, default=0, help="Also benchmark a clustered random collection of this size")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    collections = {}
+    for index_name in indexes.values():
+        source = os.path.join(LOCAL_INDEX_DIR, index_name)
+        if os.path.exists(os.path.join(source, VECTORS_FILE)):
+            collections[index_name] = (np.load(os.path.join(source, VECTORS_FILE), mmap_mode="r"), source)
+        else:
+            print(f"⚠️ {index_name}: no local index at {source}, skipped.")
+    if args.synthetic:
+        collections[f"synthetic-{args.synthetic}"] = (synthetic_collection(args.synthetic, rng), None)
+
+    for name, (vectors, source) in collections.items():
+        queries = normalize(np.load(args.queries).astype(np.float32)) if args.queries else sample_queries(np.asarray(vectors), args.num_queries, rng)
+        report(name, vectors, queries, args, source)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+# Import-time budget for the modules main.py loads before NiceGUI starts.
+# Run `python check_import_time.py`; it exits with status 1 when a module
+# takes longer than the budget to import, e.g. because a heavy library or
+# a network call crept back in at module level.
+
+# Constants
+HELPER_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES = ["pipeline_helper", "quran_helper", "sahih_bhukari_helper", "sahih_muslim_helper", "merger_helper"]
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "150"))
+
+# Cumulative import time of a module in a fresh interpreter, in milliseconds
+def measure_import_ms(module: str) -> float:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HELPER_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    # Lines look like: "import time:       self [us] |  cumulative | imported package"
+    for line in reversed(result.stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+def main() -> int:
+    failed = False
+    for module in MODULES:
+        elapsed = measure_import_ms(module)
+        ok = elapsed <= BUDGET_MS
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {module}: {elapsed:.1f} ms (budget {BUDGET_MS:.0f} ms)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
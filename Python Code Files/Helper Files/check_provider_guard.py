@@ -0,0 +1,82 @@
+import asyncio
+import sys
+from provider_guard import CircuitOpenError, ProviderGuard
+
+# Regression checks for the circuit breaker's half-open probe. Run
+# `python check_provider_guard.py`; it exits with status 1 when a check
+# fails. No provider is called: the guarded calls are local coroutines
+
+class Unavailable(Exception):
+    pass
+
+class BadRequest(Exception):
+    pass
+
+# Retryable like a 503, not an overload
+async def fail(delay: float = 0.0):
+    await asyncio.sleep(delay)
+    raise Unavailable("503 service unavailable")
+
+async def succeed(delay: float = 0.0):
+    await asyncio.sleep(delay)
+    return "ok"
+
+async def reject():
+    raise BadRequest("400 invalid argument")
+
+# A guard whose circuit is open and whose cooldown is already over, so the next call is the probe
+def half_open_guard(retries: int = 0) -> ProviderGuard:
+    guard = ProviderGuard("test", initial=4, maximum=4, timeout=1.0, retries=retries, failure_threshold=1, cooldown=0.0)
+    guard.breaker.failures, guard.breaker.opened = 1, 0.0
+    return guard
+
+async def cancelled_probe_in_backoff() -> bool:
+    guard = half_open_guard(retries=3)
+    probe = asyncio.ensure_future(guard.call(lambda: fail()))
+    while guard.retried == 0:
+        await asyncio.sleep(0)  # Until the first attempt failed and the probe is backing off
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    return await guard.call(lambda: succeed()) == "ok" and guard.breaker.opened is None
+
+async def cancelled_other_call_keeps_probe() -> bool:
+    guard = ProviderGuard("test", initial=4, maximum=4, timeout=1.0, retries=0, failure_threshold=1, cooldown=0.0)
+    other = asyncio.ensure_future(guard.call(lambda: succeed(0.2)))  # Admitted while the circuit was closed
+    await asyncio.sleep(0)
+    guard.breaker.failures, guard.breaker.opened = 1, 0.0
+    probe = asyncio.ensure_future(guard.call(lambda: succeed(0.2)))
+    await asyncio.sleep(0)
+    other.cancel()
+    await asyncio.gather(other, return_exceptions=True)
+    try:
+        await guard.call(lambda: succeed())
+        second_probe = True
+    except CircuitOpenError:
+        second_probe = False
+    await probe
+    return not second_probe and guard.breaker.opened is None
+
+async def bad_request_probe_decides_nothing() -> bool:
+    guard = half_open_guard()
+    try:
+        await guard.call(reject)
+    except BadRequest:
+        pass
+    return guard.breaker.opened is not None and guard.breaker.failures == 1 and not guard.breaker.probing
+
+CHECKS = [cancelled_probe_in_backoff, cancelled_other_call_keeps_probe, bad_request_probe_decides_nothing]
+
+def main() -> int:
+    failed = False
+    for check in CHECKS:
+        try:
+            ok = asyncio.run(check())
+        except Exception as e:
+            ok = False
+            print(f"   {type(e).__name__}: {e}")
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {check.__name__}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,24 @@
 import os
 import sys
+import asyncio
 from dotenv import load_dotenv
-from typing import Dict
-from quran_helper import user_query  # Quran query function
-from sahih_bhukari_helper import user_query_sahi_bukhari  # Bukhari query function
-from merger_helper import unified_query  # The summary merger helper
-from sahih_muslim_helper import user_query_sahi_muslim  # Muslim query function
+from typing import Dict, Tuple
+from pipeline_helper import fan_out_query, turn_report, warm_up  # Concurrent summary + per-source queries
 
 # Load environment variables
 load_dotenv()
 gem_api = os.getenv("GEMINI_API_KEY")
 pinecone_api = os.getenv("PINECONE_API_KEY")
 
-def query_all_sources(question: str) -> Dict[str, str]:
-    return {
-        "Quran": user_query(question),
-        "Sahih Bukhari": user_query_sahi_bukhari(question),
-        "Sahih Muslim": user_query_sahi_muslim(question)
-    }
+def query_all_sources(question: str) -> Tuple[str, Dict[str, str], Dict[str, float]]:
+    answers = asyncio.run(fan_out_query(question))
+    return answers["summary"], {
+        "Quran": answers["quran"],
+        "Sahih Bukhari": answers["sahih_bukhari"],
+        "Sahih Muslim": answers["sahih_muslim"]
+    }, answers["timings"]
 
-def display_results(summary: str, results: Dict[str, str]):
+def display_results(summary: str, results: Dict[str, str], timings: Dict[str, float]):
     print("\n" + "="*50)
     print(f"ISLAMIC KNOWLEDGE ASSISTANT - RESULTS")
     print("="*50)
@@ -33,6 +32,8 @@ def display_results(summary: str, results: Dict[str, str]):
         print("-"*50)
         print(response)
 
+    print(f"\n[TIMINGS] {turn_report(timings)}")
+
     print("\n" + "="*50)
     print("End of Results")
     print("="*50 + "\n")
@@ -49,6 +50,9 @@ def main():
     ********************************************
     """)
 
+    # Build shared clients and chains once up front
+    warm_up()
+
     while True:
         try:
             question = input("\nAsk your Islamic question (or type 'exit' to quit): ").strip()
@@ -62,14 +66,10 @@ def main():
 
             print("\nSearching authentic Islamic sources...")
 
-            # Get merged summary from all sources
-            summary = unified_query(question)
-            
-            # Get individual detailed references
-            results = query_all_sources(question)
-
+            # Get merged summary and individual detailed references concurrently
+            summary, results, timings = query_all_sources(question)
 
-            display_results(summary, results)
+            display_results(summary, results, timings)
 
         except KeyboardInterrupt:
             print("\nOperation cancelled by user.")
@@ -0,0 +1,101 @@
+import os
+import re
+import zlib
+from typing import Callable, Dict, Iterable, List
+import numpy as np
+from ingest_helper import format_number
+
+# Constants
+DEDUP_HADITH = os.getenv("DEDUP_HADITH", "1") == "1"  # Collapse near-duplicate hadith into one document at ingest
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))  # Estimated Jaccard similarity of the matns
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16  # 16 bands of 8 rows: a pair at Jaccard 0.8 shares a band with probability 0.95
+SHINGLE_WORDS = 5
+
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+# The matn of a hadith document: make_sahi_*_document puts the header
+# lines (number, narrator, book and chapter) before the first blank line
+def hadith_text(doc) -> str:
+    return doc.page_content.split("\n\n", 1)[-1]
+
+# crc32 of every run of SHINGLE_WORDS words; stable across processes, unlike hash()
+def shingles(text: str) -> np.ndarray:
+    words = WORD_PATTERN.findall(text.lower())
+    runs = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))}
+    return np.fromiter((zlib.crc32(run.encode("utf-8")) for run in runs), dtype=np.uint64, count=len(runs))
+
+# One MinHash value per seed: the minimum over the shingles of a
+# splitmix64 mix of (shingle ^ seed), so each seed orders the shingles
+# independently. The share of equal values between two signatures
+# estimates the Jaccard similarity of the shingle sets
+def minhash(hashes: np.ndarray, seeds: np.ndarray) -> np.ndarray:
+    z = hashes[None, :] ^ seeds[:, None]
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)  # uint64 products wrap, as splitmix64 expects
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return (z ^ (z >> np.uint64(31))).min(axis=1)
+
+def minhash_seeds(seed: int = 42) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, np.iinfo(np.uint64).max, size=NUM_PERMUTATIONS, dtype=np.uint64, endpoint=True)
+
+# Position of the canonical (first) member of each document's group.
+# Signatures that share a band bucket are candidates; a candidate pair
+# joins the same group when its signatures agree on at least `threshold`
+def duplicate_groups(signatures: np.ndarray, threshold: float = DUPLICATE_THRESHOLD) -> np.ndarray:
+    parent = np.arange(len(signatures))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    for band in range(LSH_BANDS):
+        buckets: Dict[bytes, List[int]] = {}
+        for i, key in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(key.tobytes(), []).append(i)
+        for members in buckets.values():
+            for other in members[1:]:
+                first, second = find(members[0]), find(other)
+                if first != second and np.mean(signatures[members[0]] == signatures[other]) >= threshold:
+                    parent[max(first, second)] = min(first, second)
+    return np.array([find(i) for i in range(len(signatures))])
+
+# Ingest-time near-duplicate collapse for a hadith collection. Two passes
+# over the stream: the first keeps only a MinHash signature and the hadith
+# number per row, the second yields each group's first document once,
+# with every hadith number of the group in its header and in
+# metadata["hadithNumbers"] and the dropped ids in metadata["duplicateIds"].
+# `load_documents` is called twice (the CSV is re-read instead of held).
+# A group can span the whole collection, so nothing is yielded until the
+# first pass has read every row; memory stays at one 1 KB signature per row
+def collapse_near_duplicates(load_documents: Callable[[], Iterable], threshold: float = DUPLICATE_THRESHOLD):
+    seeds = minhash_seeds()
+    signatures, numbers, ids = [], [], []
+    for doc in load_documents():
+        signatures.append(minhash(shingles(hadith_text(doc)), seeds))
+        numbers.append(format_number(doc.metadata["hadithNumber"]))
+        ids.append(doc.id)
+    if not signatures:
+        return
+    canonical = duplicate_groups(np.stack(signatures), threshold)
+
+    members: Dict[int, List[int]] = {}
+    for i, group in enumerate(canonical.tolist()):
+        members.setdefault(group, []).append(i)
+    collapsed = len(ids) - len(members)
+    print(f"🧹 Near-duplicate hadith: {len(ids)} rows, {collapsed} folded into {sum(len(m) > 1 for m in members.values())} canonical documents.")
+
+    for i, doc in enumerate(load_documents()):
+        group = members.get(i)
+        if group is None:
+            continue  # Folded into an earlier document
+        if len(group) > 1:
+            group_numbers = list(dict.fromkeys(numbers[j] for j in group))
+            header, body = doc.page_content.split("\n", 1)
+            if header.startswith("**Hadith "):
+                doc.page_content = f"**Hadith {', '.join(group_numbers)}**\n{body}"
+            doc.metadata["hadithNumbers"] = group_numbers
+            doc.metadata["duplicateIds"] = [ids[j] for j in group[1:]]
+        yield doc
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List
+from langchain_core.embeddings import Embeddings
+
+# Largest number of keys looked up in one SQL statement
+LOOKUP_CHUNK = 500
+
+# Content-addressed embedding cache. Each vector is stored as a float32
+# blob in SQLite under sha256(model name + page_content), so a re-ingest
+# only calls the embedding API for documents that are new or changed.
+# Queries are passed straight through and never cached
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, path: str, model_name: str):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self.conn.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\n{text}".encode("utf-8")).hexdigest()
+
+    def lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[i:i+LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def store(self, items: Dict[str, List[float]]):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+            )
+            self.conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        vectors = self.lookup(list(set(keys)))
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        self.hits += len(texts) - sum(key in missing for key in keys)
+        self.misses += len(missing)
+        if missing:
+            fresh = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.store(fresh)
+            vectors.update(fresh)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
@@ -0,0 +1,73 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+# Metadata fields that can be filtered on at query time, per source. A
+# filter is a dict in Pinecone syntax, {"status": "Sahih"} or
+# {"chapterEnglish": {"$in": [...]}}; multi-source calls take one such
+# dict per source, e.g. {"quran": {"revelation_type": "Meccan"}}
+FILTER_FIELDS = {
+    "quran": ["revelation_type", "surah_number"],
+    "bukhari": ["bookName", "chapterEnglish", "volume", "status"],
+    "muslim": ["bookName", "chapterEnglish", "volume", "status"]
+}
+
+# CSV column behind each metadata field, for the option lists
+CSV_COLUMNS = {"revelation_type": "Revelation Type", "surah_number": "Surah Number"}
+
+# Canonical string form of a metadata value: 2.0, 2 and "2" are all "2"
+def filter_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+# Accepted values of one filter condition
+def wanted_values(condition) -> List[str]:
+    if isinstance(condition, dict):
+        condition = condition["$in"] if "$in" in condition else [condition["$eq"]]
+    elif not isinstance(condition, (list, tuple, set)):
+        condition = [condition]
+    return [filter_value(value) for value in condition]
+
+# Whether a document's metadata satisfies every condition of a filter
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict]) -> bool:
+    return all(filter_value(metadata.get(key)) in wanted_values(condition) for key, condition in (filter or {}).items())
+
+# The filter for one source: its own conditions plus, on the combined
+# index, the "source" condition that keeps the other collections out
+def source_filter(filters: Optional[Dict[str, Dict]], source: str, combined: bool) -> Optional[Dict]:
+    merged = dict((filters or {}).get(source) or {})
+    if combined:
+        merged["source"] = source
+    return merged or None
+
+# Build the per-source filters from the chat UI's selections; empty selections are ignored
+def make_filters(revelation_type=None, surah_number=None, status=None, bukhari_chapter=None, muslim_chapter=None) -> Optional[Dict[str, Dict]]:
+    filters = {"quran": {}, "bukhari": {}, "muslim": {}}
+    if revelation_type:
+        filters["quran"]["revelation_type"] = revelation_type
+    if surah_number:
+        filters["quran"]["surah_number"] = int(surah_number)
+    if status:
+        filters["bukhari"]["status"] = status
+        filters["muslim"]["status"] = status
+    if bukhari_chapter:
+        filters["bukhari"]["chapterEnglish"] = bukhari_chapter
+    if muslim_chapter:
+        filters["muslim"]["chapterEnglish"] = muslim_chapter
+    filters = {source: conditions for source, conditions in filters.items() if conditions}
+    return filters or None
+
+# Distinct values of every filterable field, per source, read from the
+# reference table that warm_up already loads from the CSVs
+@lru_cache(maxsize=None)
+def get_filter_options() -> Dict[str, Dict[str, list]]:
+    from reference_helper import get_reference_table
+
+    values = {source: {field: set() for field in fields} for source, fields in FILTER_FIELDS.items()}
+    for reference_id, row in get_reference_table().items():
+        fields = values[reference_id.split(":")[0]]
+        for field in fields:
+            value = row.get(CSV_COLUMNS.get(field, field))
+            if value is not None:
+                fields[field].add(int(value) if field == "surah_number" else filter_value(value))
+    return {source: {field: sorted(found) for field, found in fields.items()} for source, fields in values.items()}
@@ -0,0 +1,241 @@
+import heapq
+import json
+import math
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+# File layout: magic, header length, JSON header, then every array at a
+# 64-byte aligned offset so each one can be memory-mapped in place
+MAGIC = b"DEENHNSW"
+ALIGN = 64
+
+# Hierarchical navigable small world graph over the rows of a vector
+# matrix (unit-length float32, so a dot product is the cosine score).
+# The graph only stores row ids: the vectors stay in the store's own
+# matrix and are passed into every call. Level 0 is a dense [n, 2M]
+# neighbour table; the few nodes on upper levels keep [level, M] tables
+class HNSWIndex:
+    def __init__(self, M: int = 16, ef_construction: int = 100, ef_search: int = 64, seed: int = 42):
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(M)
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.entry_point = -1
+        self.max_level = -1
+        self.levels = np.zeros(0, dtype=np.int8)
+        self.level0 = np.full((0, self.M0), -1, dtype=np.int32)
+        self.upper: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    # Neighbour table row of a node on a level; -1 marks a free slot
+    def links(self, node: int, level: int) -> np.ndarray:
+        return self.level0[node] if level == 0 else self.upper[node][level - 1]
+
+    def neighbors(self, node: int, level: int) -> np.ndarray:
+        row = self.links(node, level)
+        return row[row >= 0]
+
+    # Greedy walk towards the query on one upper level (ef = 1)
+    def greedy(self, vectors, query, node: int, score: float, level: int) -> Tuple[int, float]:
+        while True:
+            nbrs = self.neighbors(node, level)
+            if not len(nbrs):
+                return node, score
+            scores = vectors[nbrs] @ query
+            best = int(np.argmax(scores))
+            if scores[best] <= score:
+                return node, score
+            node, score = int(nbrs[best]), float(scores[best])
+
+    # Best-first search on one level; returns up to ef (score, row) pairs,
+    # best first. With `allowed`, every node is traversed but only allowed
+    # rows can enter the result set
+    def search_layer(self, vectors, query, entries: List[Tuple[float, int]], ef: int, level: int, allowed: Optional[np.ndarray] = None):
+        visited = np.zeros(self.count, dtype=bool)
+        candidates = []
+        results = []
+        for score, node in entries:
+            visited[node] = True
+            heapq.heappush(candidates, (-score, node))
+            if allowed is None or allowed[node]:
+                heapq.heappush(results, (score, node))
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_score, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_score < results[0][0]:
+                break
+            nbrs = self.neighbors(node, level)
+            nbrs = nbrs[~visited[nbrs]]
+            if not len(nbrs):
+                continue
+            visited[nbrs] = True
+            scores = vectors[nbrs] @ query
+            if len(results) >= ef:
+                # The bound only rises, so anything below it now stays out
+                keep = scores > results[0][0]
+                nbrs, scores = nbrs[keep], scores[keep]
+            for nbr, score in zip(nbrs.tolist(), scores.tolist()):
+                if len(results) < ef or score > results[0][0]:
+                    heapq.heappush(candidates, (-score, nbr))
+                    if allowed is None or allowed[nbr]:
+                        heapq.heappush(results, (score, nbr))
+                        if len(results) > ef:
+                            heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    # Neighbour selection heuristic: walk the candidates best first and keep
+    # one only if it is closer to the base than to every neighbour kept so
+    # far, which spreads links across directions instead of one cluster
+    def select_neighbors(self, vectors, candidates: List[Tuple[float, int]], m: int) -> List[int]:
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+        nodes = np.fromiter((node for _, node in candidates), dtype=np.int64, count=len(candidates))
+        scores = np.fromiter((score for score, _ in candidates), dtype=np.float32, count=len(candidates))
+        block = vectors[nodes]
+        pairwise = block @ block.T
+        selected: List[int] = []
+        for i in range(len(nodes)):
+            if not selected or pairwise[i, selected].max() < scores[i]:
+                selected.append(i)
+                if len(selected) == m:
+                    break
+        return nodes[selected].tolist()
+
+    # Add `node` to the links of `target`, pruning with the heuristic when full
+    def connect(self, vectors, target: int, node: int, level: int):
+        row = self.links(target, level)
+        free = np.flatnonzero(row < 0)
+        if len(free):
+            row[free[0]] = node
+            return
+        nodes = np.append(row, node)
+        scores = vectors[nodes] @ vectors[target]
+        order = np.argsort(-scores)
+        chosen = self.select_neighbors(vectors, list(zip(scores[order].tolist(), nodes[order].tolist())), len(row))
+        row[:] = -1
+        row[:len(chosen)] = chosen
+
+    # Make room for `size` nodes; tables loaded from a memory map are copied first
+    def reserve(self, size: int):
+        if size > len(self.level0) or not self.level0.flags.writeable:
+            capacity = max(size, 2 * len(self.level0))
+            level0 = np.full((capacity, self.M0), -1, dtype=np.int32)
+            level0[:self.count] = self.level0[:self.count]
+            levels = np.zeros(capacity, dtype=np.int8)
+            levels[:self.count] = self.levels[:self.count]
+            self.level0, self.levels = level0, levels
+            self.upper = {node: np.array(table) for node, table in self.upper.items()}
+
+    # Insert rows of `vectors` in order; rows must continue from len(self)
+    def add(self, vectors, rows: Iterable[int]):
+        rows = list(rows)
+        if not rows:
+            return
+        self.reserve(rows[-1] + 1)
+        for row in rows:
+            self.insert(vectors, row)
+
+    def insert(self, vectors, node: int):
+        level = int(-math.log(1 - self.rng.random()) * self.level_mult)
+        self.levels[node] = level
+        if level:
+            self.upper[node] = np.full((level, self.M), -1, dtype=np.int32)
+        self.count = node + 1
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+
+        query = vectors[node]
+        entry = self.entry_point
+        score = float(vectors[entry] @ query)
+        for layer in range(self.max_level, level, -1):
+            entry, score = self.greedy(vectors, query, entry, score, layer)
+        entries = [(score, entry)]
+        for layer in range(min(level, self.max_level), -1, -1):
+            found = self.search_layer(vectors, query, entries, self.ef_construction, layer)
+            found = [(s, n) for s, n in found if n != node]
+            neighbors = self.select_neighbors(vectors, found, self.M)
+            self.links(node, layer)[:len(neighbors)] = neighbors
+            for neighbor in neighbors:
+                self.connect(vectors, neighbor, node, layer)
+            entries = found
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    # Rows and scores of the (approximate) k best matches
+    def search(self, vectors, query, k: int, ef: Optional[int] = None, allowed: Optional[np.ndarray] = None):
+        if self.entry_point < 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        entry = self.entry_point
+        score = float(vectors[entry] @ query)
+        for layer in range(self.max_level, 0, -1):
+            entry, score = self.greedy(vectors, query, entry, score, layer)
+        found = self.search_layer(vectors, query, [(score, entry)], max(ef or self.ef_search, k), 0, allowed)[:k]
+        return np.array([node for _, node in found], dtype=np.int64), np.array([s for s, _ in found], dtype=np.float32)
+
+    # Write the graph into one file: header, then aligned raw arrays
+    def save(self, path: str):
+        upper_nodes = np.array(sorted(self.upper), dtype=np.int32)
+        arrays = {
+            "levels": self.levels[:self.count],
+            "level0": self.level0[:self.count],
+            "upper_nodes": upper_nodes,
+            "upper_links": np.concatenate([self.upper[node].reshape(-1) for node in upper_nodes]).astype(np.int32) if len(upper_nodes) else np.zeros(0, dtype=np.int32)
+        }
+        header = {
+            "M": self.M, "ef_construction": self.ef_construction, "count": self.count,
+            "entry_point": self.entry_point, "max_level": self.max_level, "arrays": {}
+        }
+        offset = 0
+        for name, array in arrays.items():
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset += -(-array.nbytes // ALIGN) * ALIGN
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGN) * ALIGN
+
+        with open(path, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + header["arrays"][name]["offset"])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+
+    # Memory-map a saved graph; inserting into it copies the tables first
+    @classmethod
+    def load(cls, path: str, ef_search: int = 64) -> "HNSWIndex":
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an HNSW index")
+            header_length = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(header_length))
+        data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGN) * ALIGN
+
+        def mapped(name):
+            spec = header["arrays"][name]
+            if not math.prod(spec["shape"]):
+                return np.zeros(spec["shape"], dtype=spec["dtype"])
+            return np.memmap(path, dtype=spec["dtype"], mode="r", offset=data_start + spec["offset"], shape=tuple(spec["shape"]))
+
+        index = cls(M=header["M"], ef_construction=header["ef_construction"], ef_search=ef_search)
+        index.count = header["count"]
+        index.entry_point = header["entry_point"]
+        index.max_level = header["max_level"]
+        index.levels = mapped("levels")
+        index.level0 = mapped("level0")
+        upper_links = mapped("upper_links")
+        offset = 0
+        for node in mapped("upper_nodes").tolist():
+            size = int(index.levels[node]) * index.M
+            index.upper[node] = upper_links[offset:offset + size].reshape(-1, index.M)
+            offset += size
+        # Keep drawing fresh levels for later inserts instead of replaying the seed
+        index.rng = np.random.default_rng(index.count)
+        return index
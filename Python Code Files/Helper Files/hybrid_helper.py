@@ -0,0 +1,15 @@
+from typing import Dict, Optional
+from registry_helper import get_lexical_index, HYBRID_SEARCH, RRF_K
+
+# Fuse the vector results of one index with BM25 hits from its lexical
+# index, so exact narrator names, chapter titles and ritual terms surface
+# even when the embedding misses them. Falls back to the vector results
+# when hybrid search is off or the lexical index has not been built yet
+def hybrid_search(index_name: str, query: str, vector_docs: list, k: int, filter: Optional[Dict] = None) -> list:
+    if not HYBRID_SEARCH:
+        return vector_docs[:k]
+    from lexical_index import reciprocal_rank_fusion
+    lexical_index = get_lexical_index(index_name)
+    if not len(lexical_index):
+        return vector_docs[:k]
+    return reciprocal_rank_fusion([vector_docs, lexical_index.search(query, k, filter)], k, RRF_K)
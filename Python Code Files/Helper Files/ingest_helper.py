@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Iterable, Set
+from registry_helper import clear_index, describe_embedding_cache, get_lexical_index, get_vector_count, get_vector_store, LOCAL_INDEX_DIR, VECTOR_BACKEND
+
+# Constants
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(LOCAL_INDEX_DIR, "checkpoints"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))  # Batches embedded and upserted at the same time
+INGEST_RATE = float(os.getenv("INGEST_RATE", "25"))  # Documents per second allowed by the embedding quota
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+REBUILD_INDEX = os.getenv("REBUILD_INDEX", "0") == "1"  # Delete the vectors of an index that has no checkpoint before ingesting
+INGEST_SAVE_EVERY = int(os.getenv("INGEST_SAVE_EVERY", "50"))  # Batches between writes of a local collection (and its checkpoint)
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "500"))  # Rows parsed per pandas chunk while streaming a CSV
+
+# Token bucket shared by all ingest workers: a batch of n documents takes
+# n tokens, refilled at `rate` per second up to `capacity`
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float):
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+# Quota and transient provider errors are worth retrying; anything else is not
+def is_retryable(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in ("429", "quota", "resource_exhausted", "rate limit", "too many requests", "503", "unavailable", "timeout", "deadline"))
+
+# Call fn, retrying retryable errors with jittered exponential backoff
+def with_retries(fn, *args, **kwargs):
+    for attempt in range(INGEST_MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == INGEST_MAX_RETRIES or not is_retryable(e):
+                raise
+            time.sleep(min(60, 2 ** attempt) * random.uniform(0.5, 1.5))
+
+# Hadith numbers come out of pandas as floats ("2.0"); ids use "2"
+def format_number(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+# Stable vector ids, so re-ingesting a row always overwrites the same vector
+def quran_id(surah_number, ayah_number) -> str:
+    return f"quran:{int(surah_number)}:{int(ayah_number)}"
+
+def hadith_id(source: str, hadith_number) -> str:
+    return f"{source}:{format_number(hadith_number)}"
+
+# A batch is identified by its ids and texts, so an edited hadith makes
+# its batch pending again while untouched batches stay done
+def batch_key(batch) -> str:
+    digest = hashlib.sha256()
+    for doc in batch:
+        digest.update(f"{doc.id}\t{doc.page_content}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+def checkpoint_path(index_name: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, f"{VECTOR_BACKEND}-{index_name}.json")
+
+def load_checkpoint(index_name: str) -> Set[str]:
+    path = checkpoint_path(index_name)
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return set(json.load(f))
+
+def save_checkpoint(index_name: str, done: Set[str]):
+    path = checkpoint_path(index_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(sorted(done), f)
+    os.replace(path + ".tmp", path)
+
+# Stream a CSV as Documents: pandas parses `chunk_rows` rows at a time and
+# make_document turns each row (a plain dict) into a Document, so memory
+# stays flat and the first batch can be embedded before the file is read.
+# utf-8-sig also strips the BOM some of the merged CSVs were saved with
+def iter_csv_documents(path: str, make_document, chunk_rows: int = CSV_CHUNK_ROWS):
+    import pandas as pd
+    for chunk in pd.read_csv(path, encoding="utf-8-sig", chunksize=chunk_rows):
+        for row in chunk.to_dict("records"):
+            yield make_document(row)
+
+# Lazily cut an iterable of documents into lists of batch_size
+def iter_batches(documents: Iterable, batch_size: int):
+    iterator = iter(documents)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+# Resumable, idempotent upload: documents are upserted under their stable
+# ids, every finished batch is recorded in a checkpoint file, and a re-run
+# only sends the batches that are missing, failed or changed since.
+# Batches run on a small thread pool under a shared token bucket, so CSV
+# parsing, embedding calls and upserts overlap instead of taking turns;
+# `documents` may be a generator and is consumed as workers free up.
+# Every document, skipped or not, also goes into the index's BM25 postings.
+# A local collection is written every INGEST_SAVE_EVERY batches and at the
+# end, and the checkpoint only after it, so it never lists unsaved batches
+def upsert_documents(documents: Iterable, index_name: str, batch_size: int = 100) -> int:
+    from tqdm import tqdm
+
+    vector_store = get_vector_store(index_name)
+    lexical_index = get_lexical_index(index_name)
+    done = load_checkpoint(index_name)
+    count = get_vector_count(index_name)
+    if done and count == 0:
+        print("⚠️ Index is empty but a checkpoint exists; starting over.")
+        done = set()
+    elif not done and count:
+        # Vectors without a checkpoint were written under other (e.g. random) ids;
+        # upserting on top would store every document twice
+        if not REBUILD_INDEX:
+            raise RuntimeError(
+                f"{index_name} already holds {count} vectors but has no checkpoint, so they may use other ids. "
+                "Re-run with REBUILD_INDEX=1 to delete them and ingest under stable ids."
+            )
+        print(f"🧹 Deleting the {count} vectors of {index_name} before ingesting under stable ids...")
+        clear_index(index_name)
+
+    limiter = TokenBucket(INGEST_RATE, max(INGEST_RATE, batch_size))
+
+    def upsert(batch):
+        limiter.acquire(len(batch))
+        with_retries(vector_store.add_documents, batch, ids=[doc.id for doc in batch])
+
+    # Pinecone upserts are durable as they return; local rows only after flush()
+    flush = getattr(vector_store, "flush", None)
+    unsaved = 0
+
+    def persist():
+        nonlocal unsaved
+        if flush is not None:
+            flush()
+        save_checkpoint(index_name, done)
+        unsaved = 0
+
+    skipped = upserted = failed = 0
+    duplicate_ids = set()  # Ids folded into another document by dedup; deleted once at the end
+    start = time.perf_counter()
+    total = len(documents) if hasattr(documents, "__len__") else None
+    progress = tqdm(total=total, unit="doc", desc=f"🔁 Upserting into {index_name}")
+    in_flight = {}
+
+    def collect(finished):
+        nonlocal upserted, failed, unsaved
+        for future in finished:
+            batch = in_flight.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ Error upserting batch {batch[0].id}..{batch[-1].id}: {e}")
+            else:
+                upserted += len(batch)
+                done.add(batch_key(batch))
+                unsaved += 1
+                if flush is None or unsaved >= INGEST_SAVE_EVERY:
+                    persist()
+            progress.update(len(batch))
+
+    # Batch upload to avoid exceeding 4MB API limit
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+        for batch in iter_batches(documents, batch_size):
+            lexical_index.add_documents(batch)
+            duplicate_ids.update(doc_id for doc in batch for doc_id in doc.metadata.get("duplicateIds", []))
+            if batch_key(batch) in done:
+                skipped += len(batch)
+                progress.update(len(batch))
+                continue
+            # Keep at most two batches per worker parsed ahead of the upserts
+            if len(in_flight) >= 2 * INGEST_WORKERS:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight[pool.submit(upsert, batch)] = batch
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(finished)
+    if duplicate_ids:
+        # An index built before dedup (or with DEDUP_HADITH=0) still holds the folded rows
+        with_retries(vector_store.delete, ids=sorted(duplicate_ids))
+        lexical_index.delete(duplicate_ids)
+        print(f"🧹 Removed the {len(duplicate_ids)} folded duplicate ids from {index_name} where present.")
+    persist()
+    progress.close()
+    lexical_index.save()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ {skipped} documents already done, {upserted} upserted ({upserted / max(elapsed, 1e-9):.1f} docs/s), {failed} batches failed.")
+    if failed:
+        print("🔁 Re-run to retry the failed batches; finished ones are skipped.")
+    print(f"♻️ {describe_embedding_cache()}")
+    print(f"🔎 Lexical index: {len(lexical_index)} documents, {len(lexical_index.terms)} terms.")
+    return failed
@@ -0,0 +1,179 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+from local_vector_store import MetadataIndex, to_json_value
+
+# File names inside a lexical index directory
+POSTINGS_FILE = "postings.npz"
+TERMS_FILE = "terms.json"
+DOCS_FILE = "docs.jsonl"
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset("""
+a an and are as at be been but by for from had has have he her him his i in is it its me my no not of on or our
+s she so than that the their them then there these they this those to upon us was we were what when which who
+whom will with would you your
+""".split())
+
+# Lowercased word tokens without stopwords; keeps diacritics ("hirāsh")
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+# In-process BM25 index over the same documents as a vector index. The
+# postings are stored CSR-style as three flat arrays: offsets[t]:offsets[t+1]
+# slices the rows of term t and their precomputed BM25 weights, so a query
+# is a handful of slice-and-add operations on a score array.
+# The indexed text is each document's page_content, which carries the
+# narrator, chapter and hadith text (or the ayah translation)
+class LexicalIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.terms: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.metadata_index = MetadataIndex(self.metadatas)
+        self.lock = threading.Lock()
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def load(self):
+        postings_path = os.path.join(self.path, POSTINGS_FILE)
+        if not os.path.exists(postings_path):
+            return
+        with np.load(postings_path) as postings:
+            self.offsets, self.rows, self.weights = postings["offsets"], postings["rows"], postings["weights"]
+        with open(os.path.join(self.path, TERMS_FILE), encoding="utf-8") as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(self.path, DOCS_FILE), encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.texts.append(record["page_content"])
+                self.metadatas.append(record["metadata"])
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.metadata_index.build()
+
+    # Upsert documents by id; postings are rebuilt by save()
+    def add_documents(self, documents):
+        with self.lock:
+            for doc in documents:
+                row = self.id_to_row.get(doc.id)
+                if row is None:
+                    self.id_to_row[doc.id] = len(self.ids)
+                    self.ids.append(doc.id)
+                    self.texts.append(doc.page_content)
+                    self.metadatas.append(doc.metadata)
+                else:
+                    self.texts[row] = doc.page_content
+                    self.metadatas[row] = doc.metadata
+
+    # Drop documents by id; postings are rebuilt by save()
+    def delete(self, ids):
+        with self.lock:
+            gone = set(ids) & set(self.id_to_row)
+            if not gone:
+                return
+            kept = [row for row, doc_id in enumerate(self.ids) if doc_id not in gone]
+            self.ids = [self.ids[row] for row in kept]
+            self.texts = [self.texts[row] for row in kept]
+            self.metadatas[:] = [self.metadatas[row] for row in kept]
+            self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+    # Tokenize every document and lay out the postings with BM25 weights
+    def build(self):
+        term_rows: Dict[str, List[int]] = {}
+        term_freqs: Dict[str, List[int]] = {}
+        lengths = np.zeros(len(self.texts), dtype=np.float32)
+        for row, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            lengths[row] = sum(counts.values())
+            for term, tf in counts.items():
+                term_rows.setdefault(term, []).append(row)
+                term_freqs.setdefault(term, []).append(tf)
+
+        terms = sorted(term_rows)
+        n_docs = len(self.texts)
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(float(lengths.mean()) if n_docs else 0, 1))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        rows, weights = [], []
+        for i, term in enumerate(terms):
+            term_row = np.asarray(term_rows[term], dtype=np.int32)
+            tf = np.asarray(term_freqs[term], dtype=np.float32)
+            idf = math.log(1 + (n_docs - len(term_row) + 0.5) / (len(term_row) + 0.5))
+            rows.append(term_row)
+            weights.append(idf * tf * (BM25_K1 + 1) / (tf + norms[term_row]))
+            offsets[i + 1] = offsets[i] + len(term_row)
+
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        self.weights = np.concatenate(weights).astype(np.float32) if weights else np.zeros(0, dtype=np.float32)
+        self.metadata_index.fields.clear()
+
+    # Rebuild the postings and write all three files atomically
+    def save(self):
+        with self.lock:
+            self.build()
+            os.makedirs(self.path, exist_ok=True)
+            tmp = {name: os.path.join(self.path, name + ".tmp") for name in (POSTINGS_FILE, TERMS_FILE, DOCS_FILE)}
+            with open(tmp[POSTINGS_FILE], "wb") as f:
+                np.savez(f, offsets=self.offsets, rows=self.rows, weights=self.weights)
+            with open(tmp[TERMS_FILE], "w", encoding="utf-8") as f:
+                json.dump(sorted(self.terms, key=self.terms.get), f, ensure_ascii=False)
+            with open(tmp[DOCS_FILE], "w", encoding="utf-8") as f:
+                for doc_id, text, metadata in zip(self.ids, self.texts, self.metadatas):
+                    record = {"id": doc_id, "page_content": text, "metadata": metadata}
+                    f.write(json.dumps(record, ensure_ascii=False, default=to_json_value) + "\n")
+            for name, path in tmp.items():
+                os.replace(path, os.path.join(self.path, name))
+
+    # Rows and BM25 scores of the k best matches; rows without any query term are never returned
+    def search_rows(self, query: str, k: int, filter: Optional[Dict] = None):
+        if k <= 0 or not len(self.ids):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.terms.get(term)
+            if t is not None:
+                start, end = self.offsets[t], self.offsets[t + 1]
+                scores[self.rows[start:end]] += self.weights[start:end]
+        hits = np.flatnonzero(scores)
+        if filter:
+            hits = np.intersect1d(hits, self.metadata_index.rows(filter), assume_unique=True)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return hits, scores[hits]
+
+    def search(self, query: str, k: int = 4, filter: Optional[Dict] = None):
+        from langchain_core.documents import Document
+        rows, _ = self.search_rows(query, k, filter)
+        return [Document(id=self.ids[row], page_content=self.texts[row], metadata=self.metadatas[row]) for row in rows]
+
+# Reciprocal rank fusion: every list votes 1 / (rrf_k + rank) for each of
+# its documents; documents are matched by id and the first copy is kept
+def reciprocal_rank_fusion(ranked_lists, k: int, rrf_k: int = 60):
+    scores: Dict[str, float] = {}
+    docs = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked):
+            key = doc.id or doc.page_content
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1 / (rrf_k + rank + 1)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
@@ -0,0 +1,371 @@
+import json
+import os
+import threading
+import uuid
+from typing import Dict, List, Optional
+import numpy as np
+from filter_helper import FILTER_FIELDS, filter_value, wanted_values
+
+# File names inside a collection directory
+VECTORS_FILE = "vectors.npy"
+DOCS_FILE = "docs.jsonl"
+HNSW_FILE = "hnsw.bin"
+CODES_FILE = "codes.npy"
+CODEC_FILE = "codec.npz"
+FULL_SCAN_FRACTION = 0.5  # Filters matching more rows than this share scan the whole matrix
+RESCORE_FACTOR = 4  # With quantized codes, k * this many candidates are rescored in float32
+
+# Metadata read from CSVs holds numpy scalars, which json cannot encode
+def to_json_value(value):
+    return value.item() if hasattr(value, "item") else str(value)
+
+# Precomputed row sets per metadata value: for each field, a sorted array
+# of the row ids holding each value, so a filter resolves to the matching
+# rows by a lookup and, for several conditions, an intersection. Fields
+# listed in FILTER_FIELDS are indexed up front, others on first use
+class MetadataIndex:
+    def __init__(self, metadatas: List[Dict]):
+        self.metadatas = metadatas
+        self.fields: Dict[str, Dict[str, np.ndarray]] = {}
+
+    def build(self):
+        self.fields = {}
+        for field in {"source"}.union(*FILTER_FIELDS.values()):
+            self.field(field)
+
+    def field(self, key: str) -> Dict[str, np.ndarray]:
+        if key not in self.fields:
+            groups: Dict[str, List[int]] = {}
+            for row, metadata in enumerate(self.metadatas):
+                groups.setdefault(filter_value(metadata.get(key)), []).append(row)
+            self.fields[key] = {value: np.asarray(rows, dtype=np.int64) for value, rows in groups.items()}
+        return self.fields[key]
+
+    # Sorted ids of the rows that satisfy every condition of the filter
+    def rows(self, filter: Dict) -> np.ndarray:
+        matched = None
+        for key, condition in filter.items():
+            table = self.field(key)
+            parts = [table[value] for value in wanted_values(condition) if value in table]
+            rows = np.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0] if parts else np.zeros(0, dtype=np.int64)
+            matched = rows if matched is None else np.intersect1d(matched, rows, assume_unique=True)
+            if not len(matched):
+                break
+        return matched if matched is not None else np.arange(len(self.metadatas))
+
+# A writable array with room for at least `rows` rows, holding the rows of
+# `current`; `buffer` is returned as is while it is big enough, otherwise
+# the capacity doubles, so appending n rows copies O(n) rows in total
+def reserve(buffer: Optional[np.ndarray], current: np.ndarray, rows: int) -> np.ndarray:
+    if buffer is not None and len(buffer) >= rows:
+        return buffer
+    grown = np.empty((max(rows, 2 * len(current), 1024),) + current.shape[1:], dtype=current.dtype)
+    grown[:len(current)] = current
+    return grown
+
+# Positions of the k highest scores, best first
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if not k:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+# In-process replacement for PineconeVectorStore. A collection is a
+# directory holding a contiguous float32 matrix of unit-length embeddings
+# (memory-mapped on load) plus one JSON line per document, so top-k
+# cosine search is a single matrix-vector product. Passing `hnsw`
+# parameters ({"M", "ef_construction", "ef_search"}) adds an HNSW graph
+# over the same matrix and answers unfiltered or broad searches from it.
+# Passing `quantization` ("float16", "int8" or "pq") and/or `projection`
+# ({"method": "pca" | "random", "dims": 128}) keeps a compressed copy of
+# the matrix (codes.npy) that the scan runs over; the float32 matrix
+# stays memory-mapped and only the rescored rows are read from it.
+# Added rows live in memory until flush() writes the collection to disk
+class LocalVectorStore:
+    def __init__(self, path: str, embedding, hnsw: Optional[Dict] = None, quantization: Optional[str] = None, projection: Optional[Dict] = None, rescore_factor: int = RESCORE_FACTOR):
+        self.path = path
+        self.embedding = embedding
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.vector_buffer = None  # Writable, over-allocated storage behind self.vectors once rows are added
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.metadata_index = MetadataIndex(self.metadatas)
+        self.lock = threading.Lock()  # Ingest workers may add batches concurrently
+        self.hnsw = hnsw
+        self.ann = None
+        self.quantization = quantization
+        self.projection = projection
+        self.rescore_factor = rescore_factor
+        self.codec = None
+        self.codes = None
+        self.code_buffer = None
+        self.dirty = False
+        self.load()
+        if hnsw:
+            self.load_ann(hnsw)
+        if quantization or projection:
+            self.load_codes()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # Memory-map the vectors and read the documents of an existing collection
+    def load(self):
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        docs_path = os.path.join(self.path, DOCS_FILE)
+        if not (os.path.exists(vectors_path) and os.path.exists(docs_path)):
+            return
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        with open(docs_path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.texts.append(record["page_content"])
+                self.metadatas.append(record["metadata"])
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.metadata_index.build()
+
+    # Memory-map the saved graph and insert any rows it does not cover yet
+    def load_ann(self, params: Dict):
+        from hnsw_index import HNSWIndex
+
+        graph_path = os.path.join(self.path, HNSW_FILE)
+        if os.path.exists(graph_path):
+            self.ann = HNSWIndex.load(graph_path, ef_search=params["ef_search"])
+        if self.ann is None or len(self.ann) > len(self.ids):
+            self.ann = HNSWIndex(**params)
+        if len(self.ann) < len(self.ids):
+            print(f"🔧 Adding {len(self.ids) - len(self.ann)} vectors to the HNSW graph of {self.path}...")
+            self.ann.add(self.vectors, range(len(self.ann), len(self.ids)))
+            self.save_ann()
+
+    # Memory-map the saved codes; fit the codec again when there is none of
+    # this kind or the collection has doubled since it was fitted, and
+    # encode any rows the codes do not cover yet
+    def load_codes(self):
+        from quantization import load_codec, make_codec
+
+        codes_path = os.path.join(self.path, CODES_FILE)
+        codec_path = os.path.join(self.path, CODEC_FILE)
+        if os.path.exists(codes_path) and os.path.exists(codec_path):
+            codec = load_codec(codec_path)
+            if codec.kind == make_codec(self.quantization, self.projection).kind:
+                self.codec, self.codes = codec, np.load(codes_path, mmap_mode="r")
+        if len(self.ids) and self.update_codes(range(len(self.codes) if self.codes is not None else 0, len(self.ids))):
+            self.save_codes()
+
+    # Encode the given rows, refitting everything when the codec is stale;
+    # returns whether the codes changed
+    def update_codes(self, rows) -> bool:
+        from quantization import make_codec
+
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.codec is None or len(self.codes) > len(self.ids) or 2 * self.codec.trained_rows < len(self.ids):
+            self.codec = make_codec(self.quantization, self.projection)
+            print(f"🔧 Fitting {self.codec.kind} codes for {len(self.ids)} vectors of {self.path}...")
+            self.codec.fit(self.vectors)
+            self.codes = self.codec.encode(self.vectors)
+            self.code_buffer = None
+            return True
+        if not len(rows):
+            return False
+        used = max(len(self.codes), int(rows.max()) + 1)
+        self.code_buffer = reserve(self.code_buffer, self.codes, used)
+        self.code_buffer[rows] = self.codec.encode(self.vectors[rows])
+        self.codes = self.code_buffer[:used]
+        return True
+
+    def save_codes(self):
+        from quantization import save_codec
+
+        codes_path = os.path.join(self.path, CODES_FILE)
+        codec_path = os.path.join(self.path, CODEC_FILE)
+        with open(codes_path + ".tmp", "wb") as f:
+            np.save(f, self.codes)
+        save_codec(self.codec, codec_path + ".tmp")
+        os.replace(codes_path + ".tmp", codes_path)
+        os.replace(codec_path + ".tmp", codec_path)
+
+    def save_ann(self):
+        graph_path = os.path.join(self.path, HNSW_FILE)
+        self.ann.save(graph_path + ".tmp")
+        os.replace(graph_path + ".tmp", graph_path)
+
+    # Write the files next to the old ones, then swap them in
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        vectors_tmp = os.path.join(self.path, VECTORS_FILE + ".tmp")
+        docs_tmp = os.path.join(self.path, DOCS_FILE + ".tmp")
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(docs_tmp, "w", encoding="utf-8") as f:
+            for doc_id, text, metadata in zip(self.ids, self.texts, self.metadatas):
+                record = {"id": doc_id, "page_content": text, "metadata": metadata}
+                f.write(json.dumps(record, ensure_ascii=False, default=to_json_value) + "\n")
+        os.replace(vectors_tmp, os.path.join(self.path, VECTORS_FILE))
+        os.replace(docs_tmp, os.path.join(self.path, DOCS_FILE))
+        if self.ann is not None:
+            self.save_ann()
+        if self.codec is not None:
+            self.save_codes()
+
+    # Delete the collection's files and start empty, with the same settings
+    def clear(self):
+        for name in (VECTORS_FILE, DOCS_FILE, HNSW_FILE, CODES_FILE, CODEC_FILE):
+            path = os.path.join(self.path, name)
+            if os.path.exists(path):
+                os.remove(path)
+        self.__init__(self.path, self.embedding, self.hnsw, self.quantization, self.projection, self.rescore_factor)
+
+    # Persist the rows added since the last flush (one rewrite per flush,
+    # not per batch)
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                self.save()
+                self.dirty = False
+
+    # Add pre-computed embeddings; an existing id is overwritten in place
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]], metadatas: Optional[List[Dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        with self.lock:
+            self.write_rows(texts, matrix, metadatas, ids)
+        return ids
+
+    # Merge normalized rows into the collection in memory; caller holds the
+    # lock. New rows go into the spare capacity of the buffer, so a batch
+    # costs its own rows, not a copy of the whole matrix
+    def write_rows(self, texts: List[str], matrix: np.ndarray, metadatas: List[Dict], ids: List[str]):
+        current = self.vectors if len(self.ids) else np.zeros((0, matrix.shape[1]), dtype=np.float32)
+        self.vector_buffer = vectors = reserve(self.vector_buffer, current, len(self.ids) + len(ids))
+        changed_rows = []
+        for i, doc_id in enumerate(ids):
+            row = self.id_to_row.get(doc_id)
+            if row is None:
+                row = self.id_to_row[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.texts.append(texts[i])
+                self.metadatas.append(metadatas[i])
+            else:
+                self.texts[row] = texts[i]
+                self.metadatas[row] = metadatas[i]
+            vectors[row] = matrix[i]
+            changed_rows.append(row)
+        self.vectors = vectors[:len(self.ids)]
+        # New rows join the graph; a vector replaced in place keeps its links
+        if self.ann is not None:
+            self.ann.add(self.vectors, range(len(self.ann), len(self.ids)))
+        if self.quantization or self.projection:
+            self.update_codes(changed_rows)
+        self.metadata_index.fields.clear()
+        self.dirty = True
+
+    # Drop the rows of the given ids (unknown ids are ignored). The rows
+    # after them move up, so the codes are compacted the same way and an
+    # HNSW graph is rebuilt
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> bool:
+        with self.lock:
+            rows = sorted({self.id_to_row[doc_id] for doc_id in ids or [] if doc_id in self.id_to_row})
+            if not rows:
+                return False
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[rows] = False
+            self.vectors = np.ascontiguousarray(self.vectors[keep])
+            self.vector_buffer = None
+            self.ids = [doc_id for doc_id, kept in zip(self.ids, keep) if kept]
+            self.texts = [text for text, kept in zip(self.texts, keep) if kept]
+            self.metadatas[:] = [metadata for metadata, kept in zip(self.metadatas, keep) if kept]
+            self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+            self.metadata_index.fields.clear()
+            if self.codec is not None:
+                self.codes = np.ascontiguousarray(self.codes[keep])
+                self.code_buffer = None
+            if self.ann is not None:
+                from hnsw_index import HNSWIndex
+                self.ann = HNSWIndex(**self.hnsw)
+                self.ann.add(self.vectors, range(len(self.ids)))
+            self.dirty = True
+        return True
+
+    # Same signature as the LangChain vector stores
+    def add_documents(self, documents, ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        texts = [doc.page_content for doc in documents]
+        embeddings = self.embedding.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, [doc.metadata for doc in documents], ids)
+
+    # Rows and cosine scores of the k best matches. With a filter only the
+    # matching rows are scored; rows ingested together (one chapter, one
+    # source) are contiguous, and a contiguous run is scanned as a slice.
+    # A broad filter scores every row and keeps the matches, which beats
+    # gathering most of the matrix into a copy. With an HNSW graph, the
+    # unfiltered and broad cases walk the graph instead. With quantized
+    # codes the same scan runs over the codes, keeps k * rescore_factor
+    # candidates and ranks those by their float32 vectors
+    def search_rows(self, embedding: List[float], k: int, filter: Optional[Dict] = None):
+        rows = self.metadata_index.rows(filter) if filter and len(self.ids) else None
+        if not len(self.ids) or (rows is not None and not len(rows)):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        broad = rows is None or len(rows) > FULL_SCAN_FRACTION * len(self.ids)
+        if self.ann is not None and broad:
+            allowed = None
+            if rows is not None:
+                allowed = np.zeros(len(self.ids), dtype=bool)
+                allowed[rows] = True
+            return self.ann.search(self.vectors, query, k, allowed=allowed)
+        if self.codec is not None:
+            matrix, score = self.codes, self.codec.scores
+        else:
+            matrix, score = self.vectors, np.matmul
+        if rows is None:
+            scores = score(matrix, query)
+        elif broad:
+            scores = score(matrix, query)[rows]
+        elif rows[-1] - rows[0] + 1 == len(rows):
+            scores = score(matrix[rows[0]:rows[-1] + 1], query)
+        else:
+            scores = score(matrix[rows], query)
+        top = top_k(scores, k * self.rescore_factor if self.codec is not None else k)
+        if self.codec is None:
+            return (top if rows is None else rows[top]), scores[top]
+        # Rescore in row order, so the memory-mapped reads run forwards
+        candidates = np.sort(top if rows is None else rows[top])
+        exact = self.vectors[candidates] @ query
+        best = top_k(exact, k)
+        return candidates[best], exact[best]
+
+    # Stored (unit-length) vectors of the given ids, None for an unknown id
+    def get_vectors(self, ids: List[str]) -> List[Optional[np.ndarray]]:
+        rows = [self.id_to_row.get(doc_id) for doc_id in ids]
+        found = iter(np.asarray(self.vectors[[row for row in rows if row is not None]], dtype=np.float32))
+        return [None if row is None else next(found) for row in rows]
+
+    def make_document(self, row: int):
+        from langchain_core.documents import Document
+        return Document(id=self.ids[row], page_content=self.texts[row], metadata=self.metadatas[row])
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None):
+        rows, scores = self.search_rows(embedding, k, filter)
+        return [(self.make_document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None, **kwargs):
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, filter)
+
+    # Async variants: only the embedding call awaits, the scan itself is sub-millisecond
+    async def asimilarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None, **kwargs):
+        return self.similarity_search_by_vector(embedding, k, filter)
+
+    async def asimilarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None, **kwargs):
+        return self.similarity_search_by_vector(await self.embedding.aembed_query(query), k, filter)
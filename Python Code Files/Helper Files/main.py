@@ -1,7 +1,7 @@
 import os
 import asyncio
 from dotenv import load_dotenv
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
 from nicegui import ui, app
 import time
 
@@ -11,10 +11,8 @@ chat_history: list[Tuple[str, str]] = []
 
 # Import your existing helper functions
 try:
-    from quran_helper import user_query
-    from sahih_bhukari_helper import user_query_sahi_bukhari
-    from merger_helper import unified_query
-    from sahih_muslim_helper import user_query_sahi_muslim
+    from pipeline_helper import fan_out_query, format_timings, retry_section, stream_query, turn_report, warm_up, SECTIONS
+    from filter_helper import get_filter_options, make_filters
 except ImportError:
     def user_query(question): 
         time.sleep(2)
@@ -28,6 +26,40 @@ except ImportError:
     def unified_query(question): 
         time.sleep(1)
         return f"*Summary for '{question}':*\n\nBased on Islamic sources, here is a comprehensive answer that combines insights from the Quran, Sahih Bukhari, and Sahih Muslim to provide you with authentic Islamic guidance on this topic."
+    async def fan_out_query(question, filters=None):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        summary, quran, bukhari, muslim = await asyncio.gather(
+            loop.run_in_executor(None, unified_query, question),
+            loop.run_in_executor(None, user_query, question),
+            loop.run_in_executor(None, user_query_sahi_bukhari, question),
+            loop.run_in_executor(None, user_query_sahi_muslim, question)
+        )
+        return {
+            "summary": summary,
+            "quran": quran,
+            "sahih_bukhari": bukhari,
+            "sahih_muslim": muslim,
+            "timings": {"total": time.perf_counter() - start}
+        }
+    SECTIONS = ["summary", "quran", "sahih_bukhari", "sahih_muslim"]
+    async def stream_query(question, filters=None, sections=SECTIONS):
+        start = time.perf_counter()
+        answers = await fan_out_query(question, filters)
+        for section in sections:
+            yield {"section": section, "answer": answers[section], "elapsed": time.perf_counter() - start}
+    async def retry_section(question, section, filters=None):
+        return [event async for event in stream_query(question, filters, [section])][0]
+    def format_timings(timings):
+        return " | ".join(f"{name} {elapsed:.2f}s" for name, elapsed in timings.items())
+    def turn_report(timings):
+        return f"⏱ {format_timings(timings)}"
+    def warm_up():
+        pass
+    def get_filter_options():
+        return {}
+    def make_filters(*selections):
+        return None
 
 # Load environment variables
 load_dotenv()
@@ -47,33 +79,43 @@ ui.add_head_html("""
 """)
 
 # Backend Functions
-def query_all_sources(question: str) -> Dict[str, str]:
-    """Query all Islamic sources and return results"""
-    return {
-        "quran": user_query(question),
-        "sahih_bukhari": user_query_sahi_bukhari(question),
-        "sahih_muslim": user_query_sahi_muslim(question)
-    }
-
-async def process_islamic_query(question: str) -> Dict[str, any]:
-    """Process Islamic query asynchronously"""
+async def process_islamic_query(question: str, filters: Optional[Dict[str, Dict]] = None, on_section: Optional[Callable[[Dict], None]] = None) -> Dict[str, any]:
+    """Process Islamic query asynchronously, optionally restricted by metadata filters per source.
+    With `on_section`, runs in deadline mode: every section is handed to on_section as soon as it is
+    ready or has missed its deadline, and the result only carries the timings"""
     try:
         if not question.strip():
             return {
                 "success": False,
                 "error": "Question cannot be empty"
             }
+
+        if on_section is not None:
+            timings = {}
+            try:
+                async for event in stream_query(question, filters):
+                    timings[event["section"]] = event["elapsed"]
+                    on_section(event)
+            except Exception as e:
+                if len(timings) < len(SECTIONS):
+                    raise
+                # Every section is already on screen; only the caching after them failed
+                print(f"⚠️ Could not store the answers for {question!r}: {e}")
+            timings["total"] = max(timings.values())
+            print(turn_report(timings))
+            return {"success": True, "timings": timings}
         
-        loop = asyncio.get_event_loop()
-        summary = await loop.run_in_executor(None, unified_query, question)
-        sources = await loop.run_in_executor(None, query_all_sources, question)
+        # Summary and the three sources are fetched concurrently
+        answers = await fan_out_query(question, filters)
+        print(turn_report(answers['timings']))
         
         return {
             "success": True,
-            "summary": summary,
-            "quran": sources["quran"],
-            "sahih_bukhari": sources["sahih_bukhari"],
-            "sahih_muslim": sources["sahih_muslim"]
+            "summary": answers["summary"],
+            "quran": answers["quran"],
+            "sahih_bukhari": answers["sahih_bukhari"],
+            "sahih_muslim": answers["sahih_muslim"],
+            "timings": answers["timings"]
         }
     
     except Exception as e:
@@ -170,29 +212,27 @@ def chat_ui():
             render_message('user', user_msg)
         
         input_box.value = ''
-        
-        with chat_area:
-            loading_container = ui.row().classes('w-full justify-start mb-2')
-            with loading_container:
-                with ui.card().classes(f'bg-{'#3a5a5a' if dark_mode else '#f5d596'} text-{'#f8f8f8' if dark_mode else '#1a3a5f'} px-4 py-3 rounded-lg max-w-[80%]'):
-                    with ui.row().classes('items-center gap-2'):
-                        ui.spinner(size='sm')
-                        ui.label('Searching authentic Islamic sources...').classes('text-sm')
 
         try:
-            result = await process_islamic_query(user_msg)
-            loading_container.delete()
+            filters = make_filters(
+                revelation_select.value, surah_select.value, status_select.value,
+                bukhari_chapter_select.value, muslim_chapter_select.value
+            )
+            # Every section shows a spinner and fills in as soon as its answer arrives
+            bot_response = {'question': user_msg, 'filters': filters, 'pending': list(SECTIONS), 'errors': {}, 'timings': {}}
+            chat_history.append(('bot', bot_response))
+            with chat_area:
+                slots = render_detailed_response(bot_response)
+
+            def on_section(event):
+                apply_section_event(bot_response, event)
+                fill_section(slots, event['section'], bot_response)
+
+            result = await process_islamic_query(user_msg, filters, on_section)
             
             if result.get('success'):
-                bot_response = {
-                    'summary': result.get('summary', ''),
-                    'quran': result.get('quran', ''),
-                    'sahih_bukhari': result.get('sahih_bukhari', ''),
-                    'sahih_muslim': result.get('sahih_muslim', '')
-                }
-                chat_history.append(('bot', bot_response))
-                with chat_area:
-                    render_detailed_response(bot_response)
+                bot_response['timings'] = result.get('timings', {})
+                fill_timings(slots, bot_response)
             else:
                 error_msg = result.get('error', 'Unknown error occurred')
                 chat_history.append(('bot', f"I apologize, but an error occurred: {error_msg}"))
@@ -200,10 +240,6 @@ def chat_ui():
                     render_message('bot', f"I apologize, but an error occurred: {error_msg}")
                 
         except Exception as e:
-            try:
-                loading_container.delete()
-            except:
-                pass
             error_msg = "I apologize, but I'm having trouble processing your request right now. Please try again."
             chat_history.append(('bot', error_msg))
             with chat_area:
@@ -214,6 +250,28 @@ def chat_ui():
             send_btn.enable()
             input_box.focus()
 
+    def apply_section_event(response_data, event):
+        """Record one section's answer or error in a chat history entry"""
+        name = event['section']
+        if name in response_data.get('pending', []):
+            response_data['pending'].remove(name)
+        if 'answer' in event:
+            response_data[name] = event['answer']
+            response_data.setdefault('errors', {}).pop(name, None)
+            response_data.setdefault('timings', {})[name] = event['elapsed']
+        else:
+            response_data.setdefault('errors', {})[name] = event['error']
+
+    async def retry_response_section(slots, name, response_data):
+        """Ask one timed-out or failed section again, in place"""
+        response_data['errors'].pop(name, None)
+        response_data['pending'].append(name)
+        fill_section(slots, name, response_data)
+        event = await retry_section(response_data['question'], name, response_data.get('filters'))
+        apply_section_event(response_data, event)
+        fill_section(slots, name, response_data)
+        fill_timings(slots, response_data)
+
     def render_message(sender, text):
         """Render a simple message bubble"""
         align = 'justify-end' if sender == 'user' else 'justify-start'
@@ -223,28 +281,63 @@ def chat_ui():
             with ui.card().classes(f'{bubble_color} px-4 py-3 rounded-lg max-w-[80%] shadow-sm'):
                 ui.markdown(text).classes('text-sm leading-relaxed')
 
+    section_titles = {
+        'summary': ('📋 Unified Summary', '#0e5449'),
+        'quran': ('📖 Quran References', '#2d5a27'),
+        'sahih_bukhari': ('📚 Sahih Bukhari References', '#8b4513'),
+        'sahih_muslim': ('📕 Sahih Muslim References', '#4a5568')
+    }
+
     def render_detailed_response(response_data):
-        """Render detailed response with expandable sections"""
+        """Render detailed response with expandable sections; returns the section slots so
+        sections still listed in response_data['pending'] can be filled in as they arrive"""
+        slots = {}
         with ui.row().classes('w-full justify-start mb-4'):
             with ui.card().classes(f'bg-{'#2d4a4a' if dark_mode else 'white'} border-l-4 border-{'#0e5449' if dark_mode else '#0e5449'} p-6 rounded-lg max-w-[90%] shadow-lg'):
-                if response_data.get('summary'):
-                    ui.label('📋 Unified Summary').classes(f'text-lg font-bold {'text-[#f5d596]' if dark_mode else 'text-[#0e5449]'} mb-3')
-                    ui.markdown(response_data['summary']).classes(f'text-{'#d1d5db' if dark_mode else '#1a3a5f'} mb-6 leading-relaxed bg-{'#3a5a5a' if dark_mode else '#f8f9fa'} p-4 rounded-lg')
-                
-                sources = [
-                    ('📖 Quran References', response_data.get('quran', ''), '#2d5a27'),
-                    ('📚 Sahih Bukhari References', response_data.get('sahih_bukhari', ''), '#8b4513'),
-                    ('📕 Sahih Muslim References', response_data.get('sahih_muslim', ''), '#4a5568')
-                ]
+                slots['summary'] = ui.column().classes('w-full gap-0')
                 
                 ui.label('Detailed References from Each Source:').classes(f'text-md font-semibold {'text-[#d1d5db]' if dark_mode else 'text-[#1a3a5f'} mb-3')
                 
-                for title, content, color in sources:
-                    if content:
-                        with ui.expansion(title).classes('w-full mb-2') as exp:
-                            exp.props('dense').style(f'color: {color}; font-weight: 600;')
-                            with exp:
-                                ui.markdown(content).classes(f'text-{'#d1d5db' if dark_mode else '#1a3a5f'} leading-relaxed p-3 bg-{'#2d4a4a' if dark_mode else '#fafafa'} rounded')
+                for name in ('quran', 'sahih_bukhari', 'sahih_muslim'):
+                    slots[name] = ui.column().classes('w-full gap-0')
+
+                slots['timings'] = ui.column().classes('w-full gap-0')
+
+        for name in SECTIONS:
+            fill_section(slots, name, response_data)
+        fill_timings(slots, response_data)
+        return slots
+
+    def fill_section(slots, name, response_data):
+        """Show a section's answer, a spinner while it is pending, or its error with a retry button"""
+        title, color = section_titles[name]
+        slot = slots[name]
+        slot.clear()
+        with slot:
+            if response_data.get(name):
+                if name == 'summary':
+                    ui.label(title).classes(f'text-lg font-bold {'text-[#f5d596]' if dark_mode else 'text-[#0e5449]'} mb-3')
+                    ui.markdown(response_data['summary']).classes(f'text-{'#d1d5db' if dark_mode else '#1a3a5f'} mb-6 leading-relaxed bg-{'#3a5a5a' if dark_mode else '#f8f9fa'} p-4 rounded-lg')
+                else:
+                    with ui.expansion(title).classes('w-full mb-2') as exp:
+                        exp.props('dense').style(f'color: {color}; font-weight: 600;')
+                        with exp:
+                            ui.markdown(response_data[name]).classes(f'text-{'#d1d5db' if dark_mode else '#1a3a5f'} leading-relaxed p-3 bg-{'#2d4a4a' if dark_mode else '#fafafa'} rounded')
+            elif name in response_data.get('pending', []):
+                with ui.row().classes('items-center gap-2 mb-2'):
+                    ui.spinner(size='sm')
+                    ui.label(f'{title}: searching authentic Islamic sources...').classes('text-sm text-gray-400')
+            elif name in response_data.get('errors', {}):
+                with ui.row().classes('items-center gap-2 mb-2'):
+                    ui.label(f'{title}: {response_data['errors'][name]}').classes('text-sm text-gray-400')
+                    if response_data.get('question'):
+                        ui.button('Retry', icon='refresh', on_click=lambda: asyncio.create_task(retry_response_section(slots, name, response_data))).props('dense flat no-caps')
+
+    def fill_timings(slots, response_data):
+        slots['timings'].clear()
+        if response_data.get('timings'):
+            with slots['timings']:
+                ui.label(f"⏱ {format_timings(response_data['timings'])}").classes('text-xs text-gray-400 mt-2')
 
     def render_chat_history():
         """Render the entire chat history"""
@@ -288,6 +381,19 @@ def chat_ui():
                 input_box = ui.input('Ask something about Islam...').props('dense').classes(
                     f'flex-grow px-4 py-3 border-2 border-{'#f5d596' if dark_mode else '#f5d596'} rounded-full {'bg-[#2d4a4a]' if dark_mode else 'bg-white'}'
                 ).on('keydown', on_keydown)
+                # Metadata filters, e.g. only Meccan surahs or only Sahih hadith; 'Any' leaves a field unfiltered
+                options = get_filter_options()
+                def filter_select(label, values):
+                    return ui.select({'': 'Any', **{value: str(value) for value in values}}, value='', label=label, with_input=True).classes('w-full')
+                with ui.button(icon='filter_list').props('round flat color=amber-2'):
+                    with ui.menu().props('anchor="top right" self="bottom right"'):
+                        with ui.column().classes('p-4 gap-2 w-80'):
+                            ui.label('Filter sources').classes('text-sm font-semibold')
+                            revelation_select = filter_select('Revelation type (Quran)', options.get('quran', {}).get('revelation_type', []))
+                            surah_select = filter_select('Surah number (Quran)', options.get('quran', {}).get('surah_number', []))
+                            status_select = filter_select('Hadith status', sorted(set(options.get('bukhari', {}).get('status', [])) | set(options.get('muslim', {}).get('status', []))))
+                            bukhari_chapter_select = filter_select('Chapter (Sahih Bukhari)', options.get('bukhari', {}).get('chapterEnglish', []))
+                            muslim_chapter_select = filter_select('Chapter (Sahih Muslim)', options.get('muslim', {}).get('chapterEnglish', []))
                 send_btn = ui.button('Send', on_click=lambda: asyncio.create_task(send_message())).classes(
                     f'bg-{'#2d4a4a' if dark_mode else '#f5d596'} hover:bg-{'#3a5a5a' if dark_mode else '#e6c580'} text-{'#f5d596' if dark_mode else '#020a37'} font-bold px-6 py-3 rounded-full transition-colors'
                 ).props('no-caps').bind_visibility_from(input_box, 'enabled')
@@ -310,5 +416,7 @@ def toggle_dark_mode():
     ui.notify(f'Switched to {"Dark" if dark_mode else "Light"} Mode')
     ui.update()
 
+# Build shared clients and chains once, before the first question arrives
+app.on_startup(warm_up)
 
 ui.run(title="DeenAI")
@@ -1,45 +1,90 @@
 import os
+import asyncio
+from functools import partial
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.prompts import PromptTemplate
+from registry_helper import get_embeddings, get_llm, get_provider_guard, get_vector_store, COMBINED_INDEX_NAME, USE_COMBINED_INDEX
+from filter_helper import source_filter
+from hybrid_helper import hybrid_search
+from mmr_helper import adiversify, candidate_k, diversify
 
 # Load environment variables
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 pinecone_api = os.getenv("PINECONE_API_KEY")
 
-# Set up LLM and embeddings
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.6, google_api_key=api_key, max_tokens=1500)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=api_key)
-
 # Define index names
 indexes = {
     "quran": "quran-index",
     "bukhari": "sahibukhari-index",
     "muslim": "sahimuslim-index"
 }  
+SUMMARY_K = 5  # Documents taken from each source for the summary
+LLM_TEMPERATURE = 0.6
+LLM_MAX_TOKENS = 1500
 
 # Helper function to load vector store
 def load_vector_store(index_name):
-    return PineconeVectorStore(
-        index_name=index_name,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
-    )
+    return get_vector_store(index_name)
 
-# Retrieve top documents from each source
-def retrieve_docs(query, k=5):
+# Retrieve top documents from each source; the question is embedded once
+# and the same vector is searched against every index. With the combined
+# index and no filters this is a single query ranked globally across all
+# sources. Each result list is fused with the BM25 hits of the same index,
+# fetched wider than k and cut back to k varied documents by MMR; Qur'an
+# hits are then widened to passages of their neighbouring ayahs.
+# `filters` holds optional metadata conditions per source, e.g.
+# {"quran": {"revelation_type": "Meccan"}, "bukhari": {"status": "Sahih"}}
+def retrieve_docs(query, k=SUMMARY_K, embedding=None, filters=None):
+    from passage_helper import expand_ayah_windows
+
+    if embedding is None:
+        embedding = get_embeddings().embed_query(query)
+    if USE_COMBINED_INDEX and not filters:
+        docs = load_vector_store(COMBINED_INDEX_NAME).similarity_search_by_vector(embedding, k=candidate_k(k * len(indexes)))
+        docs = hybrid_search(COMBINED_INDEX_NAME, query, docs, candidate_k(k * len(indexes)))
+        return expand_ayah_windows(diversify(COMBINED_INDEX_NAME, embedding, docs, k * len(indexes)))
     all_docs = []
     for name, index in indexes.items():
+        index = COMBINED_INDEX_NAME if USE_COMBINED_INDEX else index
+        filter = source_filter(filters, name, USE_COMBINED_INDEX)
         vs = load_vector_store(index)
-        docs = vs.similarity_search(query, k=k)
-        all_docs.extend(docs)
-    return all_docs
+        docs = vs.similarity_search_by_vector(embedding, k=candidate_k(k), filter=filter)
+        docs = hybrid_search(index, query, docs, candidate_k(k), filter)
+        all_docs.extend(diversify(index, embedding, docs, k))
+    return expand_ayah_windows(all_docs)
+
+# Async variant: query all three indexes at the same time
+async def aretrieve_docs(query, k=SUMMARY_K, embedding=None, filters=None):
+    from passage_helper import expand_ayah_windows
+
+    if embedding is None:
+        embedding = await get_provider_guard("embedding").call(lambda: get_embeddings().aembed_query(query))
+    if USE_COMBINED_INDEX and not filters:
+        store = load_vector_store(COMBINED_INDEX_NAME)
+        docs = await get_provider_guard("vector").call(lambda: store.asimilarity_search_by_vector(embedding, k=candidate_k(k * len(indexes))))
+        docs = hybrid_search(COMBINED_INDEX_NAME, query, docs, candidate_k(k * len(indexes)))
+        return expand_ayah_windows(await adiversify(COMBINED_INDEX_NAME, embedding, docs, k * len(indexes)))
+    searches = {
+        name: (COMBINED_INDEX_NAME if USE_COMBINED_INDEX else index, source_filter(filters, name, USE_COMBINED_INDEX))
+        for name, index in indexes.items()
+    }
+    results = await asyncio.gather(*(
+        get_provider_guard("vector").call(partial(load_vector_store(index).asimilarity_search_by_vector, embedding, k=candidate_k(k), filter=filter))
+        for index, filter in searches.values()
+    ))
+    results = await asyncio.gather(*(
+        adiversify(index, embedding, hybrid_search(index, query, docs, candidate_k(k), filter), k)
+        for (index, filter), docs in zip(searches.values(), results)
+    ))
+    return expand_ayah_windows([doc for docs in results for doc in docs])
 
 # Create QA summarization chain
+@lru_cache(maxsize=None)
 def get_summary_chain():
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain.prompts import PromptTemplate
+
     prompt = PromptTemplate(
         input_variables=["context", "question"],
         template = """
@@ -63,13 +108,19 @@ QUESTION:
 Answer:
 """
     )
-    return create_stuff_documents_chain(llm=llm, prompt=prompt)
+    return create_stuff_documents_chain(llm=get_llm(temperature=LLM_TEMPERATURE, max_tokens=LLM_MAX_TOKENS), prompt=prompt)
 
 # Unified interface
-def unified_query(question: str) -> str:
-    docs = retrieve_docs(question)
+def unified_query(question: str, filters=None) -> str:
+    docs = retrieve_docs(question, filters=filters)
     chain = get_summary_chain()
     result = chain.invoke({"context": docs, "question": question})
     return result
 
-
+# Async variant used by the concurrent fan-out; docs already retrieved
+# for all three sources can be passed in to skip the search
+async def aunified_query(question: str, embedding=None, docs=None, filters=None) -> str:
+    if docs is None:
+        docs = await aretrieve_docs(question, embedding=embedding, filters=filters)
+    chain = get_summary_chain()
+    return await get_provider_guard("llm").call(lambda: chain.ainvoke({"context": docs, "question": question}))
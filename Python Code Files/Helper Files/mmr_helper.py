@@ -0,0 +1,67 @@
+from typing import List, Optional
+from registry_helper import get_vector_store, MMR_FETCH_FACTOR, MMR_LAMBDA
+
+# Maximal marginal relevance over an already-retrieved candidate pool:
+# each step keeps the candidate with the best
+# lambda * relevance - (1 - lambda) * (highest similarity to anything kept),
+# so the next pick is relevant but not another copy of the same passage
+# (consecutive ayahs on one theme, parallel narrations). Searches fetch
+# candidate_k(k) documents, and diversify() keeps k of them
+
+# Documents to fetch so that MMR has a pool to choose k from
+def candidate_k(k: int) -> int:
+    return k * MMR_FETCH_FACTOR if MMR_LAMBDA < 1 else k
+
+# Positions of the k documents MMR selects, in selection order. Greedy
+# selection is prefix-stable, so the first n picks are also the MMR top-n
+def mmr_select(query, vectors, k: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    import numpy as np
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query, dtype=np.float32)
+    relevance = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    similarity = vectors @ vectors.T
+    k = min(k, len(vectors))
+    selected: List[int] = []
+    redundancy = np.zeros(len(vectors), dtype=np.float32)  # Highest similarity to a kept document
+    available = np.ones(len(vectors), dtype=bool)
+    for step in range(k):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        redundancy = similarity[pick] if step == 0 else np.maximum(redundancy, similarity[pick])
+    return selected
+
+# Stored vectors of the documents, in order, None where there is none.
+# The local store reads them from its memory-mapped matrix; the Pinecone
+# store kept them from the query that returned the documents, so BM25-only
+# hits of a hybrid search have none there
+def document_vectors(index_name: str, docs: list) -> list:
+    store = get_vector_store(index_name)
+    vectors = store.get_vectors([doc.id for doc in docs if doc.id is not None])
+    found = iter(vectors)
+    return [None if doc.id is None else next(found) for doc in docs]
+
+# The k most relevant yet mutually different documents of a candidate
+# pool. Documents without a vector keep their place in the pool and MMR
+# orders the others around them; falls back to the first k when MMR is off
+def diversify(index_name: str, embedding: Optional[List[float]], docs: list, k: int) -> list:
+    if MMR_LAMBDA >= 1 or embedding is None or len(docs) <= 1:
+        return docs[:k]
+    vectors = document_vectors(index_name, docs)
+    known = [i for i, vector in enumerate(vectors) if vector is not None]
+    if len(known) <= 1:
+        return docs[:k]
+    picks = iter(mmr_select(embedding, [vectors[i] for i in known], min(k, len(known))))
+    return [doc if vector is None else docs[known[next(picks)]] for doc, vector in zip(docs[:k], vectors[:k])]
+
+# Async variant: the vectors come from memory (or the page cache), so the
+# selection only moves off the event loop
+async def adiversify(index_name: str, embedding: Optional[List[float]], docs: list, k: int) -> list:
+    import asyncio
+
+    if MMR_LAMBDA >= 1 or embedding is None or len(docs) <= 1:
+        return docs[:k]
+    return await asyncio.to_thread(diversify, index_name, embedding, docs, k)
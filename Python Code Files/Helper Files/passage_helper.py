@@ -0,0 +1,83 @@
+import os
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from ingest_helper import quran_id
+from reference_helper import get_reference_table
+
+# Constants
+AYAH_WINDOW = int(os.getenv("AYAH_WINDOW", "1"))  # Ayahs added before and after each retrieved ayah; 0 turns expansion off
+
+# (surah, ayah) -> CSV row of every ayah in merged_quran.csv, taken from
+# the reference table that warm_up already loads
+@lru_cache(maxsize=None)
+def get_ayah_index() -> Dict[Tuple[int, int], Dict]:
+    index = {}
+    for reference_id, row in get_reference_table().items():
+        if reference_id.startswith("quran:"):
+            _, surah, ayah = reference_id.split(":")
+            index[(int(surah), int(ayah))] = row
+    return index
+
+# One passage covering the ayahs of start..end that exist in the surah;
+# the metadata of the best-ranked retrieved ayah is kept, plus the range
+# and the ayahs that were actually retrieved
+def make_passage(surah: int, start: int, end: int, hits: List, ayah_index):
+    from langchain_core.documents import Document
+
+    rows = [(ayah, ayah_index[(surah, ayah)]) for ayah in range(start, end + 1) if (surah, ayah) in ayah_index]
+    (start, first), end = rows[0], rows[-1][0]
+    span = f"Ayah {start}" if start == end else f"Ayahs {start}-{end}"
+    content = (
+        f"**Surah {first.get('Surah Name (English)')} ({first.get('Surah Name (Arabic)')}), Surah {surah}, {span}:**\n"
+        + "\n".join(f"({ayah}) {row.get('Ayah Translation', '')}" for ayah, row in rows)
+    )
+    metadata = dict(hits[0].metadata)
+    metadata.update({"ayah_start": start, "ayah_end": end, "retrieved_ayahs": sorted(int(float(doc.metadata["ayah_number"])) for doc in hits)})
+    passage_id = quran_id(surah, start) if start == end else f"{quran_id(surah, start)}-{end}"
+    return Document(id=passage_id, page_content=content, metadata=metadata)
+
+# Widen every retrieved ayah to ±window ayahs of its surah and merge
+# windows that overlap or touch into one passage. Each passage takes the
+# place of its best-ranked ayah; hadith and other documents pass through
+# unchanged. Costs dictionary lookups only: no extra search, no larger k
+def expand_ayah_windows(docs: list, window: int = AYAH_WINDOW) -> list:
+    ayah_index = get_ayah_index() if window > 0 else None
+    if not ayah_index:
+        return docs
+
+    # Indexes ingested before documents carried "source" are recognized by their ayah fields
+    def position(doc):
+        metadata = doc.metadata
+        if "surah_number" not in metadata or "ayah_number" not in metadata or "hadithNumber" in metadata:
+            return None
+        if metadata.get("source", "quran") != "quran":
+            return None
+        key = (int(float(metadata["surah_number"])), int(float(metadata["ayah_number"])))
+        return key if key in ayah_index else None
+
+    # Merged windows per surah, as [start, end, hits] in ayah order
+    windows: Dict[int, List[list]] = {}
+    for surah, ayah in sorted({key for key in map(position, docs) if key}):
+        spans = windows.setdefault(surah, [])
+        start, end = max(ayah - window, 1), ayah + window
+        if spans and start <= spans[-1][1] + 1:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end, []])
+    span_of = {}
+    for doc in docs:
+        key = position(doc)
+        if key:
+            span = next(span for span in windows[key[0]] if span[0] <= key[1] <= span[1])
+            span[2].append(doc)
+            span_of[id(doc)] = span
+
+    expanded, emitted = [], set()
+    for doc in docs:
+        span = span_of.get(id(doc))
+        if span is None:
+            expanded.append(doc)
+        elif id(span) not in emitted:
+            emitted.add(id(span))
+            expanded.append(make_passage(position(doc)[0], span[0], span[1], span[2], ayah_index))
+    return expanded
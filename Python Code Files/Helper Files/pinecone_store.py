@@ -0,0 +1,47 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_pinecone import PineconeVectorStore
+
+# PineconeVectorStore whose searches ask for the stored values too
+# (include_values=True) and keep the latest `max_vectors` of them by id,
+# so MMR reads the vectors of a candidate pool from the query it came
+# from instead of a second round trip (an Index.fetch per search)
+class PineconeStore(PineconeVectorStore):
+    def __init__(self, *args, max_vectors: int = 4096, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_vectors = max_vectors
+        self.vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.vectors_lock = threading.Lock()
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], *, k: int = 4, **kwargs):
+        namespace = kwargs.get("namespace")
+        results = self.index.query(
+            vector=embedding, top_k=k, include_metadata=True, include_values=True,
+            namespace=self._namespace if namespace is None else namespace, filter=kwargs.get("filter")
+        )
+        docs = []
+        with self.vectors_lock:
+            for match in results["matches"]:
+                metadata = dict(match["metadata"] or {})
+                if self._text_key not in metadata:
+                    continue
+                doc_id = match.get("id")
+                self.vectors[doc_id] = np.asarray(match["values"], dtype=np.float32)
+                self.vectors.move_to_end(doc_id)
+                docs.append((Document(id=doc_id, page_content=metadata.pop(self._text_key), metadata=metadata), match["score"]))
+            while len(self.vectors) > self.max_vectors:
+                self.vectors.popitem(last=False)
+        return docs
+
+    # The query runs on the client's connection pool, off the event loop
+    async def asimilarity_search_by_vector_with_score(self, embedding: List[float], *, k: int = 4, **kwargs):
+        return await asyncio.to_thread(self.similarity_search_by_vector_with_score, embedding, k=k, **kwargs)
+
+    # Vectors of the given ids as returned by recent searches, None for an id no search returned
+    def get_vectors(self, ids: List[str]) -> List[Optional[np.ndarray]]:
+        with self.vectors_lock:
+            return [self.vectors.get(doc_id) for doc_id in ids]
@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache, partial
+from typing import Any, AsyncIterator, Dict, List
+import quran_helper
+import sahih_bhukari_helper
+import sahih_muslim_helper
+from quran_helper import auser_query  # Quran query function
+from sahih_bhukari_helper import auser_query_sahi_bukhari  # Bukhari query function
+from sahih_muslim_helper import auser_query_sahi_muslim  # Muslim query function
+from merger_helper import aunified_query, get_summary_chain, indexes, load_vector_store, SUMMARY_K  # The summary merger helper
+from registry_helper import get_answer_cache, get_answer_store, get_embeddings, get_provider_guard, get_single_flight, get_lexical_index, get_vector_count, CHAT_MODEL, COMBINED_INDEX_NAME, EMBEDDING_MODEL, INDEX_VERSION, PROMPT_VERSION, USE_COMBINED_INDEX, VECTOR_BACKEND
+from filter_helper import matches_filter, source_filter
+from hybrid_helper import hybrid_search
+from mmr_helper import adiversify, candidate_k
+from reference_helper import areference_answer, get_reference_table
+from passage_helper import expand_ayah_windows, get_ayah_index
+from answer_store import normalize_question
+
+# Retrieval plan: each index is searched once, at the largest k any
+# consumer needs; the summary and the per-source chain take their slice
+RETRIEVAL_PLAN = {
+    "quran": {"summary_k": SUMMARY_K, "source_k": quran_helper.TOP_K},
+    "bukhari": {"summary_k": SUMMARY_K, "source_k": sahih_bhukari_helper.TOP_K},
+    "muslim": {"summary_k": SUMMARY_K, "source_k": sahih_muslim_helper.TOP_K}
+}
+COMBINED_POOL_K = 60  # Global candidates fetched from the combined index in one query
+SECTIONS = ["summary", "quran", "sahih_bukhari", "sahih_muslim"]
+SECTION_DEADLINES = {  # Seconds from the start of a turn after which a chat section gives up and offers a retry
+    "summary": float(os.getenv("SUMMARY_DEADLINE", "25")),
+    "quran": float(os.getenv("QURAN_DEADLINE", "20")),
+    "sahih_bukhari": float(os.getenv("BUKHARI_DEADLINE", "20")),
+    "sahih_muslim": float(os.getenv("MUSLIM_DEADLINE", "20"))
+}
+RECENT_TURNS = 64  # Prepared turns kept so a section retry reuses their evidence
+
+recent_turns: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+
+# Build every vector store handle and compiled chain before the first request
+def warm_up():
+    get_embeddings()
+    for index_name in [COMBINED_INDEX_NAME] if USE_COMBINED_INDEX else indexes.values():
+        load_vector_store(index_name)
+        get_lexical_index(index_name)
+    get_summary_chain()
+    quran_helper.get_conversational_chain()
+    sahih_bhukari_helper.get_conversational_chain_sahi_bukhari()
+    sahih_muslim_helper.get_conversational_chain_sahi_muslim()
+    get_reference_table()
+    get_ayah_index()
+    get_answer_cache()
+    get_answer_store()
+
+# Hash of the four chains' prompt templates and PROMPT_VERSION, so an
+# edited prompt never serves answers written under the old one
+@lru_cache(maxsize=None)
+def prompt_hash() -> str:
+    chains = [
+        get_summary_chain(), quran_helper.get_conversational_chain(),
+        sahih_bhukari_helper.get_conversational_chain_sahi_bukhari(), sahih_muslim_helper.get_conversational_chain_sahi_muslim()
+    ]
+    templates = [prompt.template for chain in chains for prompt in chain.get_prompts()]
+    return hashlib.sha256(json.dumps([PROMPT_VERSION, templates]).encode("utf-8")).hexdigest()[:16]
+
+# Everything a cached answer depends on besides the question and filters:
+# the prompts, both models and the sources searched (with their size for
+# the local backend, where counting is free; INDEX_VERSION for Pinecone)
+def answer_cache_version() -> tuple:
+    index_names = [COMBINED_INDEX_NAME] if USE_COMBINED_INDEX else list(indexes.values())
+    index_version = [get_vector_count(name) for name in index_names] if VECTOR_BACKEND == "local" else INDEX_VERSION
+    return prompt_hash(), CHAT_MODEL, EMBEDDING_MODEL, tuple(index_names), json.dumps(index_version)
+
+# Answer store namespace: the cache version plus the turn's filters
+def answer_namespace(version: tuple, filters=None) -> str:
+    return json.dumps([list(version), filters or {}], sort_keys=True, default=str)
+
+# Time a single branch of the fan-out
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+# Request-scoped question embedding: every helper uses the same
+# models/embedding-001 model, so one embed_query call serves all indexes
+# (and all concurrent turns asking the same text)
+async def embed_question(question: str) -> List[float]:
+    embed = partial(get_provider_guard("embedding").call, lambda: get_embeddings().aembed_query(question))
+    return await get_single_flight().do("embedding", question, embed)
+
+# One source's search, fused with its BM25 hits and cut to a varied top-k;
+# concurrent turns with the same question and source filters share it
+async def retrieve_source(name: str, question: str, embedding: List[float], filters=None) -> list:
+    k = max(RETRIEVAL_PLAN[name].values())
+    conditions = source_filter(filters, name, False)
+
+    async def search():
+        store = load_vector_store(indexes[name])
+        docs = await get_provider_guard("vector").call(lambda: store.asimilarity_search_by_vector(embedding, k=candidate_k(k), filter=conditions))
+        docs = hybrid_search(indexes[name], question, docs, candidate_k(k), conditions)
+        return await adiversify(indexes[name], embedding, docs, k)
+
+    key = (question, json.dumps(conditions, sort_keys=True, default=str))
+    return await get_single_flight().do(f"{name} retrieval", key, search)
+
+# Run one search per index, fuse it with the index's BM25 hits, keep a
+# varied top-k by MMR and slice the results for each consumer (MMR order
+# is prefix-stable, so every slice is itself an MMR top-n); returns the
+# summary docs plus the per-source docs keyed by source. `filters` holds
+# optional metadata conditions per source, applied before the scan
+async def retrieve_for_plan(question: str, embedding: List[float], filters=None) -> Dict[str, list]:
+    if USE_COMBINED_INDEX:
+        key = (question, json.dumps(filters or {}, sort_keys=True, default=str))
+        return await get_single_flight().do("combined retrieval", key, lambda: retrieve_combined(question, embedding, filters))
+    names = list(RETRIEVAL_PLAN)
+    results = await asyncio.gather(*(retrieve_source(name, question, embedding, filters) for name in names))
+    retrieved = {"summary": []}
+    for name, docs in zip(names, results):
+        retrieved["summary"].extend(docs[:RETRIEVAL_PLAN[name]["summary_k"]])
+        retrieved[name] = docs[:RETRIEVAL_PLAN[name]["source_k"]]
+    return retrieved
+
+# One global query against the combined index: the summary gets the true
+# cross-source top-k, and each source takes its best hits from the same
+# candidate pool, dropping those that fail the source's filters. The pool
+# is put in MMR order first, so every slice of it is varied. A filtered
+# follow-up runs only for a source that is under-represented
+async def retrieve_combined(question: str, embedding: List[float], filters=None) -> Dict[str, list]:
+    store = load_vector_store(COMBINED_INDEX_NAME)
+    pool = await get_provider_guard("vector").call(lambda: store.asimilarity_search_by_vector(embedding, k=COMBINED_POOL_K))
+    pool = hybrid_search(COMBINED_INDEX_NAME, question, pool, COMBINED_POOL_K)
+    if filters:
+        pool = [doc for doc in pool if matches_filter(doc.metadata, source_filter(filters, doc.metadata.get("source"), False))]
+    pool = await adiversify(COMBINED_INDEX_NAME, embedding, pool, len(pool))
+    summary_k = sum(plan["summary_k"] for plan in RETRIEVAL_PLAN.values())
+
+    retrieved = {"summary": pool[:summary_k]}
+    for name, plan in RETRIEVAL_PLAN.items():
+        retrieved[name] = [doc for doc in pool if doc.metadata.get("source") == name][:plan["source_k"]]
+
+    missing = [name for name, plan in RETRIEVAL_PLAN.items() if len(retrieved[name]) < plan["source_k"]]
+    results = await asyncio.gather(*(
+        get_provider_guard("vector").call(partial(
+            store.asimilarity_search_by_vector, embedding, k=candidate_k(RETRIEVAL_PLAN[name]["source_k"]), filter=source_filter(filters, name, True)
+        ))
+        for name in missing
+    ))
+    results = await asyncio.gather(*(
+        adiversify(
+            COMBINED_INDEX_NAME, embedding,
+            hybrid_search(COMBINED_INDEX_NAME, question, docs, candidate_k(RETRIEVAL_PLAN[name]["source_k"]), source_filter(filters, name, True)),
+            RETRIEVAL_PLAN[name]["source_k"]
+        )
+        for name, docs in zip(missing, results)
+    ))
+    retrieved.update(zip(missing, results))
+    return retrieved
+
+# Run the summary and the three per-source chains at the same time.
+# Concurrent turns with the same normalized question and filters wait on
+# the one already running, so a burst of N costs one pipeline run
+async def fan_out_query(question: str, filters=None) -> Dict[str, Any]:
+    """Query all sources concurrently; the turn takes as long as the slowest branch"""
+    answers = await get_single_flight().do("question", turn_key(question, filters), lambda: run_query(question, filters))
+    return {**answers, "timings": dict(answers["timings"])}
+
+# The single-flight key of a question under its filters
+def turn_key(question: str, filters=None) -> tuple:
+    return normalize_question(question), json.dumps(filters or {}, sort_keys=True, default=str)
+
+async def run_query(question: str, filters=None) -> Dict[str, Any]:
+    answers, turn = await shared_turn(question, filters)
+    if answers is not None:
+        return answers
+
+    # Summary and per-source answers are built from the same evidence
+    results = await asyncio.gather(*(timed(run_section(name, turn)) for name in SECTIONS))
+
+    answers = {name: result for name, (result, _) in zip(SECTIONS, results)}
+    answers["timings"] = dict(turn["timings"])
+    answers["timings"].update({name: elapsed for name, (_, elapsed) in zip(SECTIONS, results)})
+    answers["timings"]["total"] = time.perf_counter() - turn["start"]
+    await remember(turn, filters, answers)
+    return answers
+
+# prepare_turn under single-flight, so the full and the streaming mode
+# (and every tab asking the same question) embed and retrieve once
+async def shared_turn(question: str, filters=None):
+    return await get_single_flight().do("turn", turn_key(question, filters), lambda: prepare_turn(question, filters))
+
+# First half of a turn, shared by every mode: returns (answers, None) when
+# a reference lookup, the answer store or the semantic cache already
+# answers the question, else (None, turn) with the embedding, the
+# retrieved evidence and what `remember` needs to cache the answers
+async def prepare_turn(question: str, filters=None):
+    start = time.perf_counter()
+    # Bare references ("2:255", "Bukhari 1") skip embeddings, search and the chains
+    answers = await areference_answer(question, filters)
+    if answers is not None:
+        answers["timings"] = {"lookup": time.perf_counter() - start, "total": time.perf_counter() - start}
+        return answers, None
+
+    # A question asked before, by any worker, is answered from disk; SQLite
+    # calls run in a thread, since another worker may hold the write lock
+    version = answer_cache_version()
+    store, namespace = get_answer_store(), answer_namespace(version, filters)
+    stored = await asyncio.to_thread(store.get, question, namespace) if store is not None else None
+    if stored is not None:
+        stored["timings"] = {"store": time.perf_counter() - start, "total": time.perf_counter() - start}
+        return stored, None
+
+    embedding, embed_time = await timed(embed_question(question))
+    # Paraphrases of an answered question reuse its answer
+    cache = get_answer_cache()
+    if cache is not None:
+        lookup_start = time.perf_counter()
+        cached = cache.lookup(embedding, filters, version)
+        if cached is not None:
+            if store is not None:
+                await asyncio.to_thread(store.put, question, namespace, cached)
+            cached["timings"] = {"embedding": embed_time, "cache": time.perf_counter() - lookup_start, "total": time.perf_counter() - start}
+            return cached, None
+    retrieved, retrieval_time = await timed(retrieve_for_plan(question, embedding, filters))
+    # Retrieved ayahs become passages with their neighbours (dictionary lookups, no extra search)
+    retrieved = {name: expand_ayah_windows(docs) for name, docs in retrieved.items()}
+    turn = {
+        "question": question, "key": turn_key(question, filters), "start": start, "embedding": embedding,
+        "retrieved": retrieved, "version": version, "store": store, "namespace": namespace, "cache": cache,
+        "answers": {}, "timings": {"embedding": embed_time, "retrieval": retrieval_time}
+    }
+    recent_turns[turn["key"]] = turn
+    recent_turns.move_to_end(turn["key"])
+    while len(recent_turns) > RECENT_TURNS:
+        recent_turns.popitem(last=False)
+    return None, turn
+
+# The chain call of one chat section over the turn's evidence
+def section_call(name: str, question: str, retrieved: Dict[str, list]):
+    if name == "summary":
+        return aunified_query(question, docs=retrieved["summary"])
+    if name == "quran":
+        return auser_query(question, docs=retrieved["quran"])
+    if name == "sahih_bukhari":
+        return auser_query_sahi_bukhari(question, docs=retrieved["bukhari"])
+    return auser_query_sahi_muslim(question, docs=retrieved["muslim"])
+
+# One section of a turn under single-flight on (question, filters,
+# section): a streaming tab, a full-mode turn and a retry of the same
+# section share one chain call. A caller that gives up (deadline, closed
+# tab) leaves the call running, and its answer is kept in the turn, so a
+# later retry gets it without another LLM call
+async def run_section(name: str, turn: Dict[str, Any]):
+    if name in turn["answers"]:
+        return turn["answers"][name]
+
+    async def call():
+        answer = await section_call(name, turn["question"], turn["retrieved"])
+        turn["answers"][name] = answer
+        return answer
+
+    return await get_single_flight().do("section", turn["key"] + (name,), call)
+
+# Keep a complete set of section answers in the semantic cache and the answer store
+async def remember(turn: Dict[str, Any], filters, answers: Dict[str, Any]):
+    sections = {name: answers[name] for name in SECTIONS}
+    if turn["cache"] is not None:
+        turn["cache"].store(turn["embedding"], sections, filters, turn["version"])
+    if turn["store"] is not None:
+        await asyncio.to_thread(turn["store"].put, turn["question"], turn["namespace"], sections)
+
+# Deadline mode for the chat UI: yields one event per section as soon as
+# it is ready, {"section", "answer", "elapsed"}, or {"section", "error",
+# "timed_out", "elapsed"} when it failed or passed its deadline. Deadlines
+# count from the start of the turn, so the slowest section costs at most
+# its deadline and a stuck provider never holds back the others. Answers
+# are cached only when every section made it
+async def stream_query(question: str, filters=None, sections=SECTIONS) -> AsyncIterator[Dict[str, Any]]:
+    start = time.perf_counter()
+    try:
+        answers, turn = await asyncio.wait_for(shared_turn(question, filters), max(SECTION_DEADLINES[name] for name in sections))
+    except Exception as e:
+        for name in sections:
+            yield section_error(name, e, start)
+        return
+    if answers is not None:
+        for name in sections:
+            yield {"section": name, "answer": answers[name], "elapsed": time.perf_counter() - start}
+        return
+
+    tasks = {
+        asyncio.ensure_future(asyncio.wait_for(run_section(name, turn), max(SECTION_DEADLINES[name] - (time.perf_counter() - start), 0.01))): name
+        for name in sections
+    }
+    finished = {}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                if task.exception() is not None:
+                    yield section_error(name, task.exception(), start)
+                    continue
+                finished[name] = task.result()
+                yield {"section": name, "answer": finished[name], "elapsed": time.perf_counter() - start}
+    finally:
+        for task in tasks:
+            task.cancel()  # The consumer went away (e.g. the browser tab closed); shared section calls run on
+    if len(finished) == len(SECTIONS):
+        await remember(turn, filters, finished)
+
+def section_error(name: str, error: Exception, start: float) -> Dict[str, Any]:
+    timed_out = isinstance(error, asyncio.TimeoutError)
+    message = f"No answer within {SECTION_DEADLINES[name]:.0f}s" if timed_out else str(error)
+    return {"section": name, "error": message, "timed_out": timed_out, "elapsed": time.perf_counter() - start}
+
+# Run one section again with a fresh deadline (the chat UI's retry
+# button) over the evidence its turn already retrieved; an answer that
+# arrived after its deadline is returned as is, and only a turn that has
+# left `recent_turns` is embedded and retrieved again
+async def retry_section(question: str, section: str, filters=None) -> Dict[str, Any]:
+    turn = recent_turns.get(turn_key(question, filters))
+    if turn is None:
+        events = [event async for event in stream_query(question, filters, [section])]
+        return events[0]
+    start = time.perf_counter()
+    try:
+        answer = await asyncio.wait_for(run_section(section, turn), SECTION_DEADLINES[section])
+    except Exception as e:
+        return section_error(section, e, start)
+    if len(turn["answers"]) == len(SECTIONS):
+        try:
+            await remember(turn, filters, turn["answers"])  # The retry completed the turn
+        except Exception as e:
+            print(f"⚠️ Could not store the answers for {question!r}: {e}")
+    return {"section": section, "answer": answer, "elapsed": time.perf_counter() - start}
+
+# One-line timing report, e.g. "summary 2.10s | quran 1.84s | ... | total 2.10s"
+def format_timings(timings: Dict[str, float]) -> str:
+    return " | ".join(f"{name} {elapsed:.2f}s" for name, elapsed in timings.items())
+
+# Per-turn log line: the timings plus how many calls were coalesced so far
+def turn_report(timings: Dict[str, float]) -> str:
+    return f"⏱ {format_timings(timings)}. {get_single_flight().describe()}"
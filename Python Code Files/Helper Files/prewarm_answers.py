@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import sys
+import time
+
+# Pre-warm the shared answer store from a question list, so a restart or a
+# new worker starts with the common questions already answered. Run
+# `python prewarm_answers.py questions.txt` (one question per line, blank
+# lines and lines starting with # are skipped, `-` reads stdin); questions
+# already in the store are skipped unless `--force` is given
+
+from pipeline_helper import answer_cache_version, answer_namespace, fan_out_query, warm_up
+from registry_helper import ANSWER_STORE_PATH, get_answer_store, get_single_flight
+
+def read_questions(path: str) -> list:
+    lines = sys.stdin.readlines() if path == "-" else open(path, encoding="utf-8").readlines()
+    questions = [line.strip() for line in lines]
+    return list(dict.fromkeys(q for q in questions if q and not q.startswith("#")))
+
+async def prewarm(questions: list, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    done, failed = 0, 0
+
+    async def answer(question):
+        nonlocal done, failed
+        async with semaphore:
+            try:
+                await fan_out_query(question)
+                done += 1
+                print(f"✅ [{done + failed}/{len(questions)}] {question}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ [{done + failed}/{len(questions)}] {question}: {e}")
+
+    await asyncio.gather(*(answer(question) for question in questions))
+    return done, failed
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Answer a list of questions into the shared answer store")
+    parser.add_argument("questions", help="Text file with one question per line, or - for stdin")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions answered at the same time")
+    parser.add_argument("--force", action="store_true", help="Answer questions that are already stored again")
+    args = parser.parse_args()
+
+    store = get_answer_store()
+    if store is None:
+        print("⚠️ ANSWER_STORE_PATH is empty, so there is no answer store to warm.")
+        return 1
+    warm_up()
+    questions = read_questions(args.questions)
+    namespace = answer_namespace(answer_cache_version())
+    if args.force:
+        # fan_out_query answers from the store first, so forced questions are dropped beforehand
+        for question in questions:
+            store.delete(question, namespace)
+    pending = [q for q in questions if not store.contains(q, namespace)]
+    print(f"🔥 {len(questions)} questions, {len(questions) - len(pending)} already stored, {len(pending)} to answer into {ANSWER_STORE_PATH}")
+
+    start = time.perf_counter()
+    done, failed = asyncio.run(prewarm(pending, args.concurrency))
+    print(f"🏁 {done} answered, {failed} failed in {time.perf_counter() - start:.1f}s. {store.describe()} {get_single_flight().describe()}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
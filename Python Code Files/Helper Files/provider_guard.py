@@ -0,0 +1,151 @@
+import asyncio
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable
+from ingest_helper import is_retryable
+
+# Client-side protection for one provider (Gemini chat, Gemini embeddings
+# or the vector store), shared by every request in the process:
+# - an AIMD concurrency limit: +1 slot per window of fast successes, halved
+#   on a 429, a timeout or a call slower than `latency_tolerance` times
+#   the running latency, so in-flight calls settle at what the quota allows
+# - retries of quota and transient errors with full-jitter backoff
+# - a circuit breaker: after `failure_threshold` calls in a row fail, calls
+#   fail fast with CircuitOpenError for `cooldown` seconds, then one probe
+#   call decides whether to close it again
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+# Quota errors and timeouts mean "slow down"; other retryable errors only mean "try again"
+def is_overload(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("429", "quota", "resource_exhausted", "rate limit", "too many requests"))
+
+class AdaptiveLimiter:
+    def __init__(self, initial: int, maximum: int, latency_tolerance: float):
+        self.limit = float(min(initial, maximum))
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.latency = None  # Exponentially weighted mean latency of successful calls
+        self.decreased = 0.0
+        self.waiters = []
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.wake()  # Woken, then cancelled: hand the free slot to the next waiter
+                raise
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+        self.in_flight += 1
+
+    # Synchronous, so it also runs when the calling task is cancelled
+    def release(self, elapsed: float, overloaded: bool):
+        if not overloaded and self.latency is not None and elapsed > self.latency * self.latency_tolerance:
+            overloaded = True
+        if overloaded:
+            # Halve at most once per mean latency: one burst of failures is one signal
+            now = time.monotonic()
+            if now - self.decreased > (self.latency or elapsed):
+                self.limit = max(1.0, self.limit / 2)
+                self.decreased = now
+        else:
+            self.latency = elapsed if self.latency is None else 0.9 * self.latency + 0.1 * elapsed
+            self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+        self.in_flight -= 1
+        self.wake()
+
+    def wake(self):
+        for waiter in self.waiters[:max(int(self.limit) - self.in_flight, 0)]:
+            if not waiter.done():
+                waiter.set_result(None)
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None  # monotonic time the circuit opened, or None while closed
+        self.probing = False
+
+    # Raises while open; returns True when the caller is the half-open
+    # probe, which must clear `probing` however it ends
+    def check(self, name: str) -> bool:
+        if self.opened is None:
+            return False
+        remaining = self.opened + self.cooldown - time.monotonic()
+        if remaining > 0 or self.probing:
+            raise CircuitOpenError(f"{name} is unavailable; retrying in {math.ceil(max(remaining, 0))}s")
+        self.probing = True  # Half open: this call is the probe
+        return True
+
+    def record(self, success: bool):
+        if success:
+            self.failures, self.opened = 0, None
+            return
+        self.failures += 1
+        if self.opened is not None or self.failures >= self.failure_threshold:
+            self.opened = time.monotonic()
+
+class ProviderGuard:
+    def __init__(self, name: str, initial: int, maximum: int, timeout: float, retries: int,
+                 latency_tolerance: float = 3.0, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.limiter = AdaptiveLimiter(initial, maximum, latency_tolerance)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.calls = 0
+        self.retried = 0
+        self.rejected = 0
+
+    # Await start() under the limit, with a timeout and retries; `start`
+    # builds a fresh coroutine for every attempt
+    async def call(self, start: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        try:
+            probe = self.breaker.check(self.name)
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+        try:
+            for attempt in range(self.retries + 1):
+                await self.limiter.acquire()
+                began, overloaded = time.monotonic(), False
+                try:
+                    result = await asyncio.wait_for(start(), self.timeout)
+                except Exception as e:
+                    overloaded = is_overload(e)
+                    retryable = isinstance(e, asyncio.TimeoutError) or is_retryable(e)
+                    if attempt == self.retries or not retryable:
+                        if retryable:
+                            self.breaker.record(False)  # A bad request (e.g. a 400) says nothing about the provider
+                        raise
+                    self.retried += 1
+                else:
+                    self.breaker.record(True)
+                    return result
+                finally:
+                    self.limiter.release(time.monotonic() - began, overloaded)
+                await asyncio.sleep(random.uniform(0, min(8.0, 0.5 * 2 ** attempt)))
+        finally:
+            if probe:
+                # Also when cancelled while queued, calling or backing off: a
+                # probe that never finished decides nothing
+                self.breaker.probing = False
+
+    def describe(self) -> str:
+        state = "open" if self.breaker.opened is not None else "closed"
+        return (f"{self.name}: limit {int(self.limiter.limit)}, {self.limiter.in_flight} in flight, "
+                f"{self.calls} calls, {self.retried} retries, {self.rejected} rejected, circuit {state}")
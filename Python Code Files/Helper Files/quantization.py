@@ -0,0 +1,224 @@
+from typing import Dict, Optional
+import numpy as np
+
+# Compressed copies of a collection's unit-length float32 vectors. A
+# codec is fitted on the vectors, turns rows into codes, and scores codes
+# against a query with an approximate dot product; the local store ranks
+# the codes first and rescores the best candidates with the float32 rows
+SCORE_CHUNK = 1024  # Rows decoded at a time: stays in cache and never holds a float32 copy of the matrix
+PQ_CENTROIDS = 256  # One uint8 code per subspace
+PQ_SUBSPACE_DIMS = 8  # 768 dims give 96 subspaces, 256 projected dims give 32
+PQ_TRAIN_ROWS = 10000  # k-means sample size
+PQ_ITERATIONS = 12
+PCA_TRAIN_ROWS = 20000
+
+# Half-precision copy: 2 bytes per dimension, scored in float32 chunks
+class Float16Codec:
+    kind = "float16"
+
+    def __init__(self):
+        self.trained_rows = 0
+
+    def fit(self, vectors: np.ndarray):
+        self.trained_rows = len(vectors)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK):
+            out[start:start + SCORE_CHUNK] = codes[start:start + SCORE_CHUNK].astype(np.float32) @ query
+        return out
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"trained_rows": np.int64(self.trained_rows)}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        self.trained_rows = int(state["trained_rows"])
+
+# Uncompressed float32 rows; only useful under a projection
+class Float32Codec(Float16Codec):
+    kind = "float32"
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return codes @ query
+
+# Scalar int8: 1 byte per dimension with a symmetric per-dimension scale;
+# the scale is folded into the query, so scoring is codes @ (query * scale)
+class Int8Codec(Float16Codec):
+    kind = "int8"
+
+    def __init__(self):
+        super().__init__()
+        self.scale = np.ones(0, dtype=np.float32)
+
+    def fit(self, vectors: np.ndarray):
+        super().fit(vectors)
+        peak = np.abs(np.asarray(vectors, dtype=np.float32)).max(axis=0)
+        self.scale = (np.where(peak > 0, peak, 1) / 127).astype(np.float32)
+
+    # Rows added after the fit may exceed the fitted range; they are clipped
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(np.asarray(vectors, dtype=np.float32) / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return super().scores(codes, query * self.scale)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {**super().state(), "scale": self.scale}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        super().set_state(state)
+        self.scale = state["scale"]
+
+# Product quantization: the dimensions are split into groups of
+# PQ_SUBSPACE_DIMS, each row stores the nearest of 256 k-means centroids
+# per group (768 dims, 96 groups: 96 bytes a row). A query is scored by asymmetric distance:
+# one [subspaces, 256] table of centroid · query-slice products, then a
+# lookup-and-sum over each row's codes
+class PQCodec:
+    kind = "pq"
+
+    def __init__(self, subspaces: Optional[int] = None, seed: int = 42):
+        self.subspaces = subspaces
+        self.seed = seed
+        self.trained_rows = 0
+        self.centroids = np.zeros((0, 0, 0), dtype=np.float32)
+
+    def fit(self, vectors: np.ndarray):
+        dims = vectors.shape[1]
+        self.subspaces = self.subspaces or max(dims // PQ_SUBSPACE_DIMS, 1)
+        if dims % self.subspaces:
+            raise ValueError(f"{dims} dimensions do not split into {self.subspaces} PQ subspaces")
+        rng = np.random.default_rng(self.seed)
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), size=min(len(vectors), PQ_TRAIN_ROWS), replace=False))], dtype=np.float32)
+        sample = np.ascontiguousarray(sample.reshape(len(sample), self.subspaces, -1).transpose(1, 0, 2))
+        count = min(PQ_CENTROIDS, sample.shape[1])
+        self.centroids = np.stack([kmeans(points, count, rng) for points in sample])
+        self.trained_rows = len(vectors)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for start in range(0, len(vectors), SCORE_CHUNK):
+            block = np.asarray(vectors[start:start + SCORE_CHUNK], dtype=np.float32).reshape(-1, self.subspaces, self.centroids.shape[2])
+            for j in range(self.subspaces):
+                codes[start:start + len(block), j] = nearest(block[:, j], self.centroids[j])
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        table = np.einsum("jcd,jd->jc", self.centroids, query.reshape(self.subspaces, -1)).ravel()
+        offsets = np.arange(self.subspaces, dtype=np.intp) * self.centroids.shape[1]
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK):
+            out[start:start + SCORE_CHUNK] = table[codes[start:start + SCORE_CHUNK] + offsets].sum(axis=1)
+        return out
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"trained_rows": np.int64(self.trained_rows), "centroids": self.centroids}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        self.trained_rows = int(state["trained_rows"])
+        self.centroids = state["centroids"]
+        self.subspaces = len(self.centroids)
+
+# Index of the closest centroid for every point (squared L2)
+def nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.argmin((centroids ** 2).sum(axis=1) - 2 * points @ centroids.T, axis=1)
+
+# Lloyd's k-means; an emptied cluster keeps its previous centroid
+def kmeans(points: np.ndarray, count: int, rng) -> np.ndarray:
+    centroids = points[rng.choice(len(points), size=count, replace=False)].copy()
+    for _ in range(PQ_ITERATIONS):
+        assigned = nearest(points, centroids)
+        sizes = np.bincount(assigned, minlength=count)
+        sums = np.stack([np.bincount(assigned, weights=points[:, d], minlength=count) for d in range(points.shape[1])], axis=1)
+        filled = sizes > 0
+        centroids[filled] = sums[filled] / sizes[filled, None]
+    return centroids
+
+# Linear projection to fewer dimensions in front of another codec, fitted
+# on the corpus: "pca" keeps the top principal components, "random" is an
+# orthonormalized Gaussian matrix. Documents are stored as
+# (x - mean) @ matrix and queries scored as q @ matrix; the mean shifts
+# every document score by the same q · mean, so the ranking is unchanged
+class ProjectionCodec:
+    def __init__(self, method: str = "pca", dims: int = 256, inner=None, seed: int = 42):
+        if method not in ("pca", "random"):
+            raise ValueError(f"Unknown projection {method!r}; use 'pca' or 'random'")
+        self.method = method
+        self.dims = dims
+        self.inner = inner or Float32Codec()
+        self.seed = seed
+        self.mean = np.zeros(0, dtype=np.float32)
+        self.matrix = np.zeros((0, dims), dtype=np.float32)
+
+    @property
+    def kind(self) -> str:
+        return f"{self.method}{self.dims}/{self.inner.kind}"
+
+    @property
+    def trained_rows(self) -> int:
+        return self.inner.trained_rows
+
+    def fit(self, vectors: np.ndarray):
+        source_dims = vectors.shape[1]
+        if self.dims >= source_dims:
+            raise ValueError(f"Cannot project {source_dims} dimensions to {self.dims}")
+        rng = np.random.default_rng(self.seed)
+        if self.method == "pca":
+            sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), size=min(len(vectors), PCA_TRAIN_ROWS), replace=False))], dtype=np.float64)
+            self.mean = sample.mean(axis=0).astype(np.float32)
+            centered = sample - self.mean
+            _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+            self.matrix = np.ascontiguousarray(eigenvectors[:, ::-1][:, :self.dims], dtype=np.float32)
+        else:
+            self.mean = np.zeros(source_dims, dtype=np.float32)
+            self.matrix = np.linalg.qr(rng.normal(size=(source_dims, self.dims)))[0].astype(np.float32)
+        self.inner.fit(self.project(vectors))
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.matrix
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return self.inner.encode(self.project(vectors))
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return self.inner.scores(codes, query @ self.matrix)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        inner = {f"inner_{name}": value for name, value in self.inner.state().items()}
+        return {"mean": self.mean, "matrix": self.matrix, **inner}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        self.mean, self.matrix = state["mean"], state["matrix"]
+        self.inner.set_state({name[len("inner_"):]: value for name, value in state.items() if name.startswith("inner_")})
+
+CODECS = {codec.kind: codec for codec in (Float32Codec, Float16Codec, Int8Codec, PQCodec)}
+
+# Codec for a store's settings: `quantization` is a CODECS kind or None,
+# `projection` is {"method": "pca" | "random", "dims": int} or None
+def make_codec(quantization: Optional[str] = None, projection: Optional[Dict] = None):
+    codec = CODECS[quantization or "float32"]()
+    if projection:
+        codec = ProjectionCodec(projection["method"], projection["dims"], codec)
+    return codec
+
+def save_codec(codec, path: str):
+    with open(path, "wb") as f:
+        np.savez(f, kind=np.array(codec.kind), **codec.state())
+
+def load_codec(path: str):
+    with np.load(path) as state:
+        kind = str(state["kind"])
+        if "/" in kind:
+            projection, inner = kind.split("/")
+            method = projection.rstrip("0123456789")
+            codec = make_codec(inner, {"method": method, "dims": int(projection[len(method):])})
+        else:
+            codec = make_codec(kind)
+        codec.set_state({name: state[name] for name in state.files if name != "kind"})
+    return codec
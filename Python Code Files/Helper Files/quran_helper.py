@@ -1,17 +1,11 @@
 import os
-import pandas as pd
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.documents import Document
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableMap
-from langchain_core.output_parsers import StrOutputParser
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone as PineconeClient, ServerlessSpec
-from tqdm import tqdm
-
-
-
+from registry_helper import get_embeddings, get_llm, get_pinecone_client, get_provider_guard, get_vector_store, COMBINED_INDEX_NAME, USE_COMBINED_INDEX, VECTOR_BACKEND
+from filter_helper import source_filter
+from hybrid_helper import hybrid_search
+from mmr_helper import adiversify, candidate_k, diversify
+from ingest_helper import iter_csv_documents, quran_id, upsert_documents
 
 # Load environment variables
 load_dotenv()
@@ -23,71 +17,74 @@ CSV_PATH = r"D:\Air Uni Notes\Semester 4\Information Retrieval\IR Project\GitHub
 INDEX_NAME = "quran-index"
 DIMENSIONS = 768 # Google embedding size
 REGION = "us-east-1"
+TOP_K = 5  # Documents passed to this source's answer chain
+SOURCE = "quran"  # Value of the "source" metadata field in the combined index
+LLM_TEMPERATURE = 0.2  # Sampling temperature of this source's answer chain
+
+# Create the Pinecone index on first ingestion if it does not exist yet
+def ensure_index():
+    if VECTOR_BACKEND != "pinecone":
+        return
+    from pinecone import ServerlessSpec
+    pc = get_pinecone_client()
+    if INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=DIMENSIONS,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=REGION)
+        )
 
-# Set up LLM and embeddings
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2, google_api_key=gem_api)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=gem_api)
-
-# Pinecone setup
-pc = PineconeClient(api_key=pinecone_api)
+# Convert one Qur’an CSV row into a Document
+def make_quran_document(row):
+    from langchain_core.documents import Document
 
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=DIMENSIONS,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region=REGION)
+    content = (
+        f"**Surah {row['Surah Name (English)']} ({row['Surah Name (Arabic)']}), "
+        f"Surah {row['Surah Number']}, Ayah {int(row['Ayah Number'])}:**\n"
+        f"{row['Ayah Translation']}"
     )
-
-# Load and chunk Qur’an CSV
+    metadata = {
+        "source": SOURCE,
+        "surah_english": row['Surah Name (English)'],
+        "surah_arabic": row['Surah Name (Arabic)'],
+        "surah_number": row["Surah Number"],
+        "ayah_number": row["Ayah Number"],
+        "revelation_type": row.get("Revelation Type", "Unknown")
+    }
+    return Document(id=quran_id(row["Surah Number"], row["Ayah Number"]), page_content=content, metadata=metadata)
+
+# Stream the Qur’an CSV as Documents, one per ayah; no chunking needed
+# since ayahs are already concise
 def load_quran_csv():
-    df = pd.read_csv(CSV_PATH, encoding="utf-8")
-    documents = []
-    for _, row in df.iterrows():
-        content = (
-            f"**Surah {row['Surah Name (English)']} ({row['Surah Name (Arabic)']}), "
-            f"Surah {row['Surah Number']}, Ayah {int(row['Ayah Number'])}:**\n"
-            f"{row['Ayah Translation']}"
-        )
-        metadata = {
-            "surah_english": row['Surah Name (English)'],
-            "surah_arabic": row['Surah Name (Arabic)'],
-            "surah_number": row["Surah Number"],
-            "ayah_number": row["Ayah Number"],
-            "revelation_type": row.get("Revelation Type", "Unknown")
-        }
-        documents.append(Document(page_content=content, metadata=metadata))
-    return documents  # No chunking needed if ayahs are already concise
-
-
-# Create vector store using Pinecone
-def create_vector_store(documents, batch_size=100):
-    vector_store = PineconeVectorStore(
-        index_name=INDEX_NAME,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
-    )
+    return iter_csv_documents(CSV_PATH, make_quran_document)
 
-    # Batch upload to avoid exceeding 4MB API limit
-    for i in tqdm(range(0, len(documents), batch_size), desc="🔁 Uploading to Pinecone"):
-        batch = documents[i:i+batch_size]
-        try:
-            vector_store.add_documents(batch)
-        except Exception as e:
-            print(f"❌ Error uploading batch {i}-{i+batch_size}: {e}")
 
-    print(f"\n✅ Successfully uploaded {len(documents)} documents to Pinecone.")
+# Upsert documents into Pinecone under their stable ids
+def create_vector_store(documents, batch_size=100):
+    ensure_index()
+    return upsert_documents(documents, INDEX_NAME, batch_size)
 
 # Load Pinecone vector store
 def load_vector_store():
-    return PineconeVectorStore(
-        index_name=INDEX_NAME,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
-    )
+    return get_vector_store(search_index_name())
+
+# Index searched for this source: its own, or the combined one
+def search_index_name():
+    return COMBINED_INDEX_NAME if USE_COMBINED_INDEX else INDEX_NAME
+
+# Metadata filter for a search: the caller's conditions, e.g.
+# {"revelation_type": "Meccan"}, plus the source when searching the combined index
+def search_filter(filters=None):
+    return source_filter({SOURCE: filters}, SOURCE, USE_COMBINED_INDEX)
 
 # QA Prompt
+@lru_cache(maxsize=None)
 def get_conversational_chain():
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnableMap
+    from langchain_core.output_parsers import StrOutputParser
+
     prompt_template = """You are DeenAI, an Islamic assistant helping users with authentic responses directly from the Qur'an.
 
 Given the following context (extracted from the Qur'an), answer the user's question **strictly based** on the Ayah translations provided.
@@ -115,15 +112,36 @@ Answer:
             "question": lambda x: x["question"]
         })
         | prompt
-        | llm
+        | get_llm(temperature=LLM_TEMPERATURE)
         | StrOutputParser()
     )
     return chain
 
-# Handle user query
-def user_query(query):
+# Handle user query: a wider search, fused with BM25 hits, cut to a varied
+# TOP_K and widened to the neighbouring ayahs
+def user_query(query, filters=None):
+    from passage_helper import expand_ayah_windows
+
     vector_store = load_vector_store()
-    docs = vector_store.similarity_search(query, k=5)
+    embedding = get_embeddings().embed_query(query)
+    docs = vector_store.similarity_search_by_vector(embedding, k=candidate_k(TOP_K), filter=search_filter(filters))
+    docs = hybrid_search(search_index_name(), query, docs, candidate_k(TOP_K), search_filter(filters))
+    docs = expand_ayah_windows(diversify(search_index_name(), embedding, docs, TOP_K))
     chain = get_conversational_chain()
     return chain.invoke({"input_documents": docs, "question": query})
 
+# Async variant used by the concurrent fan-out; pass a precomputed
+# question embedding to skip re-embedding the query, or already
+# retrieved docs to skip the search altogether
+async def auser_query(query, embedding=None, docs=None, filters=None):
+    from passage_helper import expand_ayah_windows
+
+    if docs is None:
+        vector_store = load_vector_store()
+        if embedding is None:
+            embedding = await get_provider_guard("embedding").call(lambda: get_embeddings().aembed_query(query))
+        docs = await get_provider_guard("vector").call(lambda: vector_store.asimilarity_search_by_vector(embedding, k=candidate_k(TOP_K), filter=search_filter(filters)))
+        docs = hybrid_search(search_index_name(), query, docs, candidate_k(TOP_K), search_filter(filters))
+        docs = expand_ayah_windows(await adiversify(search_index_name(), embedding, docs, TOP_K))
+    chain = get_conversational_chain()
+    return await get_provider_guard("llm").call(lambda: chain.ainvoke({"input_documents": docs, "question": query}))
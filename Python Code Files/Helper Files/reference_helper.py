@@ -0,0 +1,130 @@
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Optional
+import quran_helper
+import sahih_bhukari_helper
+import sahih_muslim_helper
+from filter_helper import matches_filter, source_filter
+from ingest_helper import format_number, hadith_id, quran_id
+from registry_helper import get_llm, get_provider_guard
+
+# Constants
+REFERENCE_EXPLANATION = os.getenv("REFERENCE_EXPLANATION", "0") == "1"  # Add a short LLM explanation under the verbatim text
+EXPLANATION_MAX_TOKENS = 200
+LLM_TEMPERATURE = 0.2
+
+# Answer key of each source in the fan-out result
+ANSWER_KEYS = {"quran": "quran", "bukhari": "sahih_bukhari", "muslim": "sahih_muslim"}
+HADITH_SOURCES = {"bukhari": "bukhari", "bukhaari": "bukhari", "bokhari": "bukhari", "muslim": "muslim"}
+# Document builder of each source, for the metadata the chat filters test
+MAKE_DOCUMENT = {
+    "quran": quran_helper.make_quran_document,
+    "bukhari": sahih_bhukari_helper.make_sahi_bukhari_document,
+    "muslim": sahih_muslim_helper.make_sahi_muslim_document
+}
+
+# Leading words that do not change the reference ("show me", "what is the")
+FILLER_PATTERN = re.compile(r"^(?:please\s+)?(?:(?:show|give|quote|read|recite|find)(?:\s+me)?\s+|what\s+is\s+|what's\s+)?(?:the\s+)?")
+QURAN_PATTERNS = [
+    re.compile(r"(\d{1,3})\s*:\s*(\d{1,3})"),  # "2:255"; a bare "2.5" is a number, not a reference
+    re.compile(r"(?:(?:the\s+)?(?:holy\s+)?qur'?an|surah|sura|surat)\s*(\d{1,3})\s*[:.]\s*(\d{1,3})"),  # "Quran 2.255", "Surah 2:255"
+    re.compile(r"(?:surah|sura|surat)\s*(\d{1,3})\s*[,:]?\s*(?:ayah|ayat|aya|verse)\s*(\d{1,3})")  # "Surah 2 ayah 255"
+]
+HADITH_PATTERN = re.compile(r"(?:sahih\s+(?:al[- ])?)?(bukhari|bukhaari|bokhari|muslim)\s*(?:hadith|hadees|no\.?|number|#)?\s*(\d{1,5}[a-z]?)")  # "Bukhari 1", "Sahih Muslim hadith 2"
+
+# Stable id of the ayah or hadith a question asks for verbatim, or None
+# when the question is anything more than a bare reference
+def parse_reference(question: str) -> Optional[str]:
+    text = FILLER_PATTERN.sub("", question.strip().lower().rstrip("?!. "))
+    for pattern in QURAN_PATTERNS:
+        match = pattern.fullmatch(text)
+        if match:
+            return quran_id(match.group(1), match.group(2))
+    match = HADITH_PATTERN.fullmatch(text)
+    if match:
+        return hadith_id(HADITH_SOURCES[match.group(1)], match.group(2))
+    return None
+
+# Every CSV row keyed by the same stable id the vector indexes use, so a
+# parsed reference is a single dict lookup. Loaded once per process
+@lru_cache(maxsize=None)
+def get_reference_table() -> Dict[str, Dict[str, Any]]:
+    import pandas as pd
+
+    sources = [
+        (quran_helper.CSV_PATH, lambda row: quran_id(row["Surah Number"], row["Ayah Number"])),
+        (sahih_bhukari_helper.CSV_PATH, lambda row: hadith_id("bukhari", row["hadithNumber"])),
+        (sahih_muslim_helper.CSV_PATH, lambda row: hadith_id("muslim", row["hadithNumber"]))
+    ]
+    table = {}
+    for path, key in sources:
+        if not os.path.exists(path):
+            print(f"⚠️ Reference lookup: {path} not found; those references go through search.")
+            continue
+        for row in pd.read_csv(path, encoding="utf-8-sig").to_dict("records"):
+            table[key(row)] = {name: value for name, value in row.items() if value == value}  # Drop NaN cells
+    return table
+
+# Verbatim ayah or hadith with all of its metadata, as markdown
+def format_reference(reference_id: str, row: Dict[str, Any]) -> str:
+    if reference_id.startswith("quran:"):
+        return (
+            f"**Surah {row.get('Surah Name (English)')} ({row.get('Surah Name (Arabic)')}), "
+            f"Surah {format_number(row.get('Surah Number'))}, Ayah {format_number(row.get('Ayah Number'))}**"
+            f" · {row.get('Revelation Type', 'Unknown')}\n\n"
+            f"{row.get('Ayah Arabic', '')}\n\n"
+            f"{row.get('Ayah Translation', '')}"
+        )
+    details = [
+        f"**{label}:** {format_number(row[field])}"
+        for label, field in [("Chapter", "chapterEnglish"), ("Volume", "volume"), ("Writer", "writerName"), ("Status", "status")]
+        if field in row
+    ]
+    return (
+        f"**{row.get('bookName', '')}, Hadith {format_number(row.get('hadithNumber'))}**\n\n"
+        f"**Narrated by:** {row.get('englishNarrator', '')}\n\n"
+        f"{' | '.join(details)}\n\n"
+        f"{row.get('hadithEnglish', '')}"
+    )
+
+# Short explanation of a single ayah or hadith
+@lru_cache(maxsize=None)
+def get_explanation_chain():
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+
+    prompt = PromptTemplate.from_template("""You are DeenAI, an Islamic assistant.
+
+Explain the meaning of the following text in 2 to 3 sentences, based strictly on the text itself.
+Do not quote or cite any other Ayah or Hadith.
+
+TEXT: {text}
+
+Explanation:
+""")
+    return prompt | get_llm(temperature=LLM_TEMPERATURE, max_tokens=EXPLANATION_MAX_TOKENS) | StrOutputParser()
+
+# Fast path for bare references: returns a fan-out shaped answer straight
+# from the lookup table, or None to send the question through search,
+# also when the chat filters of its source exclude the ayah or hadith
+async def areference_answer(question: str, filters: Optional[Dict[str, Dict]] = None) -> Optional[Dict[str, Any]]:
+    reference_id = parse_reference(question)
+    if reference_id is None:
+        return None
+    row = get_reference_table().get(reference_id)
+    if row is None:
+        return None
+    source = reference_id.split(":")[0]
+    conditions = source_filter(filters, source, False)
+    if conditions and not matches_filter(MAKE_DOCUMENT[source](row).metadata, conditions):
+        return None
+
+    verbatim = format_reference(reference_id, row)
+    summary = verbatim
+    if REFERENCE_EXPLANATION:
+        summary = await get_provider_guard("llm").call(lambda: get_explanation_chain().ainvoke({"text": verbatim}))
+    answers = {"summary": summary, "reference": reference_id}
+    answers.update({key: "" for key in ANSWER_KEYS.values()})
+    answers[ANSWER_KEYS[source]] = verbatim
+    return answers
@@ -0,0 +1,158 @@
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+gem_api = os.getenv("GEMINI_API_KEY")
+pinecone_api = os.getenv("PINECONE_API_KEY")
+
+# Constants
+CHAT_MODEL = "gemini-2.0-flash"
+EMBEDDING_MODEL = "models/embedding-001"
+POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))  # Keep-alive connections shared by all indexes
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")  # "pinecone" or "local"
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Vector Index"))
+LOCAL_INDEX_ENGINE = os.getenv("LOCAL_INDEX_ENGINE", "exact")  # "exact" scan or "hnsw" graph for the local backend
+HNSW_PARAMS = {
+    "M": int(os.getenv("HNSW_M", "16")),  # Links per node; more links, better recall, bigger graph
+    "ef_construction": int(os.getenv("HNSW_EF_CONSTRUCTION", "100")),  # Candidate list while inserting
+    "ef_search": int(os.getenv("HNSW_EF_SEARCH", "64"))  # Candidate list while searching; tunable without a rebuild
+}
+LOCAL_QUANTIZATION = os.getenv("LOCAL_QUANTIZATION", "")  # "", "float16", "int8" or "pq" codes for the local scan
+LOCAL_PROJECTION = os.getenv("LOCAL_PROJECTION", "")  # "", "pca" or "random" projection in front of the local codes
+PROJECTION_DIMS = int(os.getenv("PROJECTION_DIMS", "256"))  # 256 or 128: 3x or 6x smaller scans than 768
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))  # Quantized or projected candidates per result rescored in float32
+COMBINED_INDEX_NAME = os.getenv("COMBINED_INDEX_NAME", "deenai-index")  # All sources, tagged with a "source" metadata field
+USE_COMBINED_INDEX = os.getenv("USE_COMBINED_INDEX", "0") == "1"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(LOCAL_INDEX_DIR, "embedding_cache.sqlite"))  # Empty to disable
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(LOCAL_INDEX_DIR, "lexical"))  # BM25 postings, built at ingest for either backend
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"  # Fuse BM25 hits into the vector results
+RRF_K = int(os.getenv("RRF_K", "60"))  # Reciprocal rank fusion damping constant
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))  # Relevance vs. novelty of the retrieved context; 1 turns MMR off
+MMR_FETCH_FACTOR = int(os.getenv("MMR_FETCH_FACTOR", "3"))  # Candidates fetched per document kept by MMR
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "1")  # Bump to invalidate cached answers; prompt template edits already do
+INDEX_VERSION = os.getenv("INDEX_VERSION", "1")  # Bump after re-ingesting into Pinecone; local indexes are versioned by their size
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))  # Cached answers kept in memory; 0 disables the cache
+ANSWER_CACHE_MB = float(os.getenv("ANSWER_CACHE_MB", "64"))  # Memory cap of the cached answers and question embeddings
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # Seconds a cached answer stays valid
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # Question cosine similarity that counts as the same question
+ANSWER_STORE_PATH = os.getenv("ANSWER_STORE_PATH", os.path.join(LOCAL_INDEX_DIR, "answer_store.sqlite"))  # Shared by all workers; empty to disable
+ANSWER_STORE_MB = float(os.getenv("ANSWER_STORE_MB", "256"))  # Least recently used answers are deleted beyond this size
+PROVIDER_LIMITS = {  # Starting and highest calls in flight (AIMD adapts in between) and seconds per attempt
+    "llm": {"label": "Gemini chat", "initial": int(os.getenv("LLM_CONCURRENCY", "8")), "maximum": int(os.getenv("LLM_MAX_CONCURRENCY", "32")), "timeout": float(os.getenv("LLM_TIMEOUT", "60"))},
+    "embedding": {"label": "Gemini embeddings", "initial": int(os.getenv("EMBEDDING_CONCURRENCY", "16")), "maximum": int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "64")), "timeout": float(os.getenv("EMBEDDING_TIMEOUT", "10"))},
+    "vector": {"label": "Vector store", "initial": int(os.getenv("VECTOR_CONCURRENCY", "16")), "maximum": int(os.getenv("VECTOR_MAX_CONCURRENCY", "64")), "timeout": float(os.getenv("VECTOR_TIMEOUT", "10"))}
+}
+PROVIDER_RETRIES = int(os.getenv("PROVIDER_RETRIES", "3"))  # Retries of a 429, timeout or transient error, with jittered backoff
+LATENCY_TOLERANCE = float(os.getenv("LATENCY_TOLERANCE", "3"))  # A call this many times slower than usual counts as congestion
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # Failed calls in a row that open a provider's circuit
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))  # Seconds an open circuit fails fast before one probe call
+
+# Process-wide registry: every client, vector store handle and chain is
+# built once on first use and then shared by all requests. The Gemini,
+# LangChain and Pinecone libraries are only imported here, on first use,
+# so importing the helpers stays cheap and never touches the network
+
+# One Gemini chat client per sampling configuration
+@lru_cache(maxsize=None)
+def get_llm(temperature: float, max_tokens: int = None):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=CHAT_MODEL, temperature=temperature, google_api_key=gem_api, max_tokens=max_tokens)
+
+# One embeddings client for the whole process; document embeddings go
+# through the on-disk cache so re-ingests only embed new or changed text
+@lru_cache(maxsize=None)
+def get_embeddings():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=gem_api)
+    if not EMBEDDING_CACHE_PATH:
+        return embeddings
+    from embedding_cache import CachedEmbeddings
+    return CachedEmbeddings(embeddings, EMBEDDING_CACHE_PATH, EMBEDDING_MODEL)
+
+# Summary of the embedding cache for ingestion logs
+def describe_embedding_cache() -> str:
+    embeddings = get_embeddings()
+    if not EMBEDDING_CACHE_PATH:
+        return "Embedding cache disabled."
+    return f"Embedding cache: {embeddings.hits} reused, {embeddings.misses} newly embedded."
+
+# One semantic answer cache for the process, or None when disabled
+@lru_cache(maxsize=None)
+def get_answer_cache():
+    if ANSWER_CACHE_SIZE <= 0:
+        return None
+    from answer_cache import SemanticAnswerCache
+    return SemanticAnswerCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, int(ANSWER_CACHE_MB * 2**20), ANSWER_CACHE_TTL)
+
+# One connection per process to the on-disk answer store, or None when disabled
+@lru_cache(maxsize=None)
+def get_answer_store():
+    if not ANSWER_STORE_PATH:
+        return None
+    from answer_store import AnswerStore
+    return AnswerStore(ANSWER_STORE_PATH, int(ANSWER_STORE_MB * 2**20))
+
+# One single-flight table for the process: concurrent identical questions
+# and sub-calls share one in-flight task
+@lru_cache(maxsize=None)
+def get_single_flight():
+    from single_flight import SingleFlight
+    return SingleFlight()
+
+# One limiter, retry policy and circuit breaker per provider ("llm",
+# "embedding" or "vector"), shared by every request in the process
+@lru_cache(maxsize=None)
+def get_provider_guard(provider: str):
+    from provider_guard import ProviderGuard
+    limits = PROVIDER_LIMITS[provider]
+    return ProviderGuard(
+        limits["label"], limits["initial"], limits["maximum"], limits["timeout"], PROVIDER_RETRIES,
+        latency_tolerance=LATENCY_TOLERANCE, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN
+    )
+
+# One Pinecone client, so every index reuses the same HTTP connection pool
+@lru_cache(maxsize=None)
+def get_pinecone_client():
+    from pinecone import Pinecone as PineconeClient
+    return PineconeClient(api_key=pinecone_api, pool_threads=POOL_THREADS)
+
+# One vector store handle per index, on Pinecone or in process
+@lru_cache(maxsize=None)
+def get_vector_store(index_name: str):
+    if VECTOR_BACKEND == "local":
+        from local_vector_store import LocalVectorStore
+        hnsw = HNSW_PARAMS if LOCAL_INDEX_ENGINE == "hnsw" else None
+        return LocalVectorStore(
+            os.path.join(LOCAL_INDEX_DIR, index_name), get_embeddings(), hnsw=hnsw,
+            quantization=LOCAL_QUANTIZATION or None, rescore_factor=RESCORE_FACTOR,
+            projection={"method": LOCAL_PROJECTION, "dims": PROJECTION_DIMS} if LOCAL_PROJECTION else None
+        )
+
+    from pinecone_store import PineconeStore
+    return PineconeStore(
+        index=get_pinecone_client().Index(index_name),
+        embedding=get_embeddings(),
+        pinecone_api_key=pinecone_api
+    )
+
+# One BM25 index per vector index, read from disk on first use; empty
+# until an ingest run has built it
+@lru_cache(maxsize=None)
+def get_lexical_index(index_name: str):
+    from lexical_index import LexicalIndex
+    return LexicalIndex(os.path.join(LEXICAL_INDEX_DIR, index_name))
+
+# Delete every vector of an index
+def clear_index(index_name: str):
+    if VECTOR_BACKEND == "local":
+        get_vector_store(index_name).clear()
+    else:
+        get_pinecone_client().Index(index_name).delete(delete_all=True)
+
+# Number of vectors already stored in an index
+def get_vector_count(index_name: str) -> int:
+    if VECTOR_BACKEND == "local":
+        return len(get_vector_store(index_name))
+    return get_pinecone_client().Index(index_name).describe_index_stats().total_vector_count
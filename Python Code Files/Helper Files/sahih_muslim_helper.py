@@ -1,14 +1,11 @@
 import os
-import pandas as pd
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.documents import Document
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableMap
-from langchain_core.output_parsers import StrOutputParser
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone as PineconeClient, ServerlessSpec
-from tqdm import tqdm
+from registry_helper import get_embeddings, get_llm, get_pinecone_client, get_provider_guard, get_vector_store, COMBINED_INDEX_NAME, USE_COMBINED_INDEX, VECTOR_BACKEND
+from filter_helper import source_filter
+from hybrid_helper import hybrid_search
+from mmr_helper import adiversify, candidate_k, diversify
+from ingest_helper import hadith_id, iter_csv_documents, upsert_documents
 
 # Load environment variables
 load_dotenv()
@@ -20,70 +17,81 @@ CSV_PATH = r"D:\Air Uni Notes\Semester 4\Information Retrieval\IR Project\GitHub
 INDEX_NAME = "sahimuslim-index"
 DIMENSIONS = 768  # Google embedding size
 REGION = "us-east-1"
+TOP_K = 5  # Documents passed to this source's answer chain
+SOURCE = "muslim"  # Value of the "source" metadata field in the combined index
+LLM_TEMPERATURE = 0.2  # Sampling temperature of this source's answer chain
+
+# Create the Pinecone index on first ingestion if it does not exist yet
+def ensure_index_sahi_muslim():
+    if VECTOR_BACKEND != "pinecone":
+        return
+    from pinecone import ServerlessSpec
+    pc = get_pinecone_client()
+    if INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=DIMENSIONS,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=REGION)
+        )
 
-# Set up LLM and embeddings
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2, google_api_key=gem_api)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=gem_api)
-
-# Pinecone setup
-pc = PineconeClient(api_key=pinecone_api)
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=DIMENSIONS,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region=REGION)
-    )
+# Convert one CSV row into a Document
+def make_sahi_muslim_document(row):
+    from langchain_core.documents import Document
 
-# Load and convert CSV into Documents
-def load_sahi_muslim_csv():
-    df = pd.read_csv(CSV_PATH, encoding="utf-8")
-    documents = []
-    for _, row in df.iterrows():
-        content = (
-            f"**Hadith {row['hadithNumber']}**\n"
-            f"**Narrated by:** {row['englishNarrator']}\n"
-            f"**Book:** {row['bookName']} | **Chapter:** {row['chapterEnglish']}\n\n"
-            f"{row['hadithEnglish']}"
-        )
-        metadata = {
-            "hadithNumber": row["hadithNumber"],
-            "englishNarrator": row["englishNarrator"],
-            "bookName": row["bookName"],
-            "chapterEnglish": row["chapterEnglish"],
-            "writerName": row.get("writerName", ""),
-            "volume": row.get("volume", ""),
-            "status": row.get("status", "")
-        }
-        documents.append(Document(page_content=content, metadata=metadata))
-    return documents
-
-# Create Pinecone vector store
-def create_vector_store_sahi_muslim(documents, batch_size=100):
-    vector_store = PineconeVectorStore(
-        index_name=INDEX_NAME,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
+    content = (
+        f"**Hadith {row['hadithNumber']}**\n"
+        f"**Narrated by:** {row['englishNarrator']}\n"
+        f"**Book:** {row['bookName']} | **Chapter:** {row['chapterEnglish']}\n\n"
+        f"{row['hadithEnglish']}"
     )
+    metadata = {
+        "source": SOURCE,
+        "hadithNumber": row["hadithNumber"],
+        "englishNarrator": row["englishNarrator"],
+        "bookName": row["bookName"],
+        "chapterEnglish": row["chapterEnglish"],
+        "writerName": row.get("writerName", ""),
+        "volume": row.get("volume", ""),
+        "status": row.get("status", "")
+    }
+    return Document(id=hadith_id(SOURCE, row["hadithNumber"]), page_content=content, metadata=metadata)
+
+# Stream the CSV as Documents; the ingestion batches pull from this
+# generator, so embedding starts as soon as the first batch is parsed.
+# Near-duplicate matns are folded into one document on the way
+# (dedup_helper; DEDUP_HADITH=0 keeps every row)
+def load_sahi_muslim_csv():
+    from dedup_helper import DEDUP_HADITH, collapse_near_duplicates
+    if DEDUP_HADITH:
+        return collapse_near_duplicates(lambda: iter_csv_documents(CSV_PATH, make_sahi_muslim_document))
+    return iter_csv_documents(CSV_PATH, make_sahi_muslim_document)
 
-    for i in tqdm(range(0, len(documents), batch_size), desc="🔁 Uploading to Pinecone"):
-        batch = documents[i:i+batch_size]
-        try:
-            vector_store.add_documents(batch)
-        except Exception as e:
-            print(f"❌ Error uploading batch {i}-{i+batch_size}: {e}")
-    print(f"\n✅ Successfully uploaded {len(documents)} documents to Pinecone.")
+# Upsert documents into Pinecone under their stable ids
+def create_vector_store_sahi_muslim(documents, batch_size=100):
+    ensure_index_sahi_muslim()
+    return upsert_documents(documents, INDEX_NAME, batch_size)
 
 # Load vector store for searching
 def load_vector_store_sahi_muslim():
-    return PineconeVectorStore(
-        index_name=INDEX_NAME,
-        embedding=embeddings,
-        pinecone_api_key=pinecone_api
-    )
+    return get_vector_store(search_index_name_sahi_muslim())
+
+# Index searched for this source: its own, or the combined one
+def search_index_name_sahi_muslim():
+    return COMBINED_INDEX_NAME if USE_COMBINED_INDEX else INDEX_NAME
+
+# Metadata filter for a search: the caller's conditions, e.g.
+# {"status": "Sahih"}, plus the source when searching the combined index
+def search_filter_sahi_muslim(filters=None):
+    return source_filter({SOURCE: filters}, SOURCE, USE_COMBINED_INDEX)
 
 # Build modern QA chain using RunnableMap
+@lru_cache(maxsize=None)
 def get_conversational_chain_sahi_muslim():
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnableMap
+    from langchain_core.output_parsers import StrOutputParser
+
     prompt_template = """You are DeenAI, an Islamic assistant helping users with authentic responses strictly from authentic Hadith sources.
 
 Given the following context (extracted from the Hadith), answer the user's question **strictly based** on the Hadith translations provided.
@@ -116,14 +124,31 @@ Answer:
             "question": lambda x: x["question"]
         })
         | prompt
-        | llm
+        | get_llm(temperature=LLM_TEMPERATURE)
         | StrOutputParser()
     )
     return chain
 
-# Handle user query
-def user_query_sahi_muslim(query):
+# Handle user query: a wider search, fused with BM25 hits, cut to a varied TOP_K
+def user_query_sahi_muslim(query, filters=None):
     vector_store = load_vector_store_sahi_muslim()
-    docs = vector_store.similarity_search(query, k=5)
+    embedding = get_embeddings().embed_query(query)
+    docs = vector_store.similarity_search_by_vector(embedding, k=candidate_k(TOP_K), filter=search_filter_sahi_muslim(filters))
+    docs = hybrid_search(search_index_name_sahi_muslim(), query, docs, candidate_k(TOP_K), search_filter_sahi_muslim(filters))
+    docs = diversify(search_index_name_sahi_muslim(), embedding, docs, TOP_K)
     chain = get_conversational_chain_sahi_muslim()
     return chain.invoke({"input_documents": docs, "question": query})
+
+# Async variant used by the concurrent fan-out; pass a precomputed
+# question embedding to skip re-embedding the query, or already
+# retrieved docs to skip the search altogether
+async def auser_query_sahi_muslim(query, embedding=None, docs=None, filters=None):
+    if docs is None:
+        vector_store = load_vector_store_sahi_muslim()
+        if embedding is None:
+            embedding = await get_provider_guard("embedding").call(lambda: get_embeddings().aembed_query(query))
+        docs = await get_provider_guard("vector").call(lambda: vector_store.asimilarity_search_by_vector(embedding, k=candidate_k(TOP_K), filter=search_filter_sahi_muslim(filters)))
+        docs = hybrid_search(search_index_name_sahi_muslim(), query, docs, candidate_k(TOP_K), search_filter_sahi_muslim(filters))
+        docs = await adiversify(search_index_name_sahi_muslim(), embedding, docs, TOP_K)
+    chain = get_conversational_chain_sahi_muslim()
+    return await get_provider_guard("llm").call(lambda: chain.ainvoke({"input_documents": docs, "question": query}))
@@ -0,0 +1,31 @@
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Hashable
+
+# Single-flight request coalescing: while a call for a key is in flight,
+# further calls with the same key await the same task instead of starting
+# the work again, and all of them get its result (or its exception). The
+# task is shielded, so a caller that goes away does not cancel the others.
+# `calls` and `coalesced` count, per kind of call, how many were made and
+# how many were served by a call already in flight
+class SingleFlight:
+    def __init__(self):
+        self.in_flight = {}
+        self.calls = Counter()
+        self.coalesced = Counter()
+
+    async def do(self, kind: str, key: Hashable, start: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls[kind] += 1
+        flight = (kind, key)
+        task = self.in_flight.get(flight)
+        if task is None:
+            task = asyncio.ensure_future(start())
+            self.in_flight[flight] = task
+            task.add_done_callback(lambda done: self.in_flight.pop(flight) if self.in_flight.get(flight) is done else None)
+        else:
+            self.coalesced[kind] += 1
+        return await asyncio.shield(task)
+
+    def describe(self) -> str:
+        counts = ", ".join(f"{kind} {self.coalesced[kind]}/{calls}" for kind, calls in self.calls.items())
+        return f"Coalesced calls: {counts or 'none yet'}."